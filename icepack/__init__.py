@@ -10,9 +10,51 @@
 # The full text of the license can be found in the file LICENSE in the
 # icepack source directory or at <http://www.gnu.org/licenses/>.
 
+r"""The top-level package only imports what every simulation needs eagerly.
+All of the other submodules, like `meshing` and `datasets`, and the classes
+and functions that are exported from them are imported on first access, so
+that `import icepack` doesn't pull in heavy dependencies like pygmsh, pooch,
+or matplotlib that many programs never use."""
+
+import sys
+import importlib
+
 from icepack.norms import norm
 from icepack.interpolate import interpolate
 from icepack.utilities import depth_average, lift3d
-from icepack.models.viscosity import rate_factor
-import icepack.meshing
-import icepack.datasets
+
+_submodules = ['constants', 'datasets', 'inverse', 'meshing', 'models',
+               'optimization', 'plot', 'solvers', 'timestepping', 'utilities']
+
+_attributes = {
+    'NetCDFSource': 'icepack.interpolate',
+    'RasterCache': 'icepack.interpolate',
+    'rate_factor': 'icepack.models.viscosity',
+    'DiagnosticSolver': 'icepack.solvers',
+    'CoupledSolver': 'icepack.solvers',
+    'Simulation': 'icepack.timestepping',
+    'ThermomechanicalSimulation': 'icepack.timestepping'
+}
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module('icepack.' + name)
+    if name in _attributes:
+        value = getattr(importlib.import_module(_attributes[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module 'icepack' has no attribute '{}'".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules) | set(_attributes))
+
+
+# Module-level `__getattr__` is only supported from Python 3.7 on, so older
+# versions get everything that used to be imported eagerly
+if sys.version_info < (3, 7):
+    import icepack.meshing
+    import icepack.datasets
+    for _name in _attributes:
+        __getattr__(_name)
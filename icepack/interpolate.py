@@ -13,21 +13,529 @@
 r"""Functions for interpolating gridded remote sensing data sets to finite
 element spaces"""
 
+import os
+import hashlib
+import collections
 import numpy as np
 import ufl
 import firedrake
-import rasterio
 
-def interpolate(f, Q):
+#: The order of the spline used by each interpolation method
+interpolation_orders = {'nearest': 0, 'linear': 1, 'cubic': 3}
+
+
+#: The georeferencing information of a raster, which is all that's needed to
+#: decide which part of it to read
+_RasterGeometry = collections.namedtuple(
+    '_RasterGeometry', ['transform', 'height', 'width', 'nodata'])
+
+
+def _geometry(dataset):
+    return _RasterGeometry(dataset.transform, dataset.height, dataset.width,
+                           dataset.nodata)
+
+
+def _pixel_coordinates(geometry, X):
+    r"""Return the fractional row and column indices of some points in the
+    raster, measured so that the pixel centers are at whole numbers"""
+    cols, rows = ~geometry.transform * (X[:, 0], X[:, 1])
+    return np.asarray(rows) - 0.5, np.asarray(cols) - 0.5
+
+
+def _window_bounds(geometry, rows, cols, padding):
+    r"""Return the start and stop rows and columns of the smallest window of
+    the raster that contains all the given fractional pixel indices plus
+    some padding
+
+    The window always contains at least one pixel. If the points lie
+    entirely off one side of the raster, it's the row or column of pixels
+    along that edge.
+    """
+    height, width = geometry.height, geometry.width
+    row_start = int(np.floor(rows.min())) - padding
+    row_start = min(max(row_start, 0), height - 1)
+    row_stop = min(int(np.ceil(rows.max())) + padding + 1, height)
+    row_stop = max(row_stop, row_start + 1)
+
+    col_start = int(np.floor(cols.min())) - padding
+    col_start = min(max(col_start, 0), width - 1)
+    col_stop = min(int(np.ceil(cols.max())) + padding + 1, width)
+    col_stop = max(col_stop, col_start + 1)
+
+    return row_start, row_stop, col_start, col_stop
+
+
+class GriddedSource(object):
+    r"""Base class for gridded data sets that aren't rasterio data sets
+
+    Subclasses describe a regular grid through the same attributes as a
+    rasterio data set -- an affine `transform` from pixel indices to
+    coordinates, the `height` and `width` of the grid, the `nodata` value
+    and a `name` -- and implement :meth:`read_window` to read part of it.
+    This is all that :func:`interpolate` needs, so any such source uses the
+    same windowed, cached interpolation as rasters do.
+    """
+    transform = None
+    height = 0
+    width = 0
+    nodata = None
+    name = ''
+
+    #: The file that backs the source, if any; the on-disk cache only stores
+    #: tiles of file-backed sources
+    filename = None
+
+    def read_window(self, bounds, band=1):
+        r"""Return a window of the data as floating-point numbers, with
+        missing values replaced by NaN
+
+        Parameters
+        ----------
+        bounds : tuple of int
+            The start and stop row and start and stop column of the window
+        band : int, optional
+            The band to read, for sources with more than one
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class NetCDFSource(GriddedSource):
+    r"""A variable of a NetCDF file on a regular grid
+
+    Products like MEaSUREs or BedMachine are distributed as NetCDF files
+    with many large variables. Rather than decode all of them through GDAL,
+    this object opens the file with xarray, which only reads the parts of
+    the variable that are asked for. Using it requires that the optional
+    `xarray` package be installed.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the NetCDF file
+    variable : str
+        The name of the variable to read
+    x, y : str, optional
+        The names of the horizontal coordinates of the variable
+    chunks : int or dict, optional
+        If given, the chunk sizes that dask will use to read the variable;
+        by default the variable is read without dask
+    **indexers
+        Labels to select along any other dimensions of the variable, for
+        example a time
+    """
+    def __init__(self, filename, variable, x='x', y='y', chunks=None,
+                 **indexers):
+        import xarray
+        from affine import Affine
+
+        self._dataset = xarray.open_dataset(filename, chunks=chunks)
+        array = self._dataset[variable]
+        if indexers:
+            array = array.sel(**indexers)
+        if set(array.dims) != {x, y}:
+            raise ValueError('Variable must only depend on {} and {} after '
+                             'indexing, but has dimensions {}!'
+                             .format(x, y, array.dims))
+        self._array = array.transpose(y, x)
+
+        xs, ys = self._dataset[x].values, self._dataset[y].values
+        dx, dy = xs[1] - xs[0], ys[1] - ys[0]
+        if not (np.allclose(np.diff(xs), dx) and np.allclose(np.diff(ys), dy)):
+            raise ValueError('Coordinates of the NetCDF file must be evenly '
+                             'spaced!')
+
+        # The coordinates are those of the pixel centers, and `dy` is
+        # usually negative so that the first row is the northernmost
+        self.transform = Affine(dx, 0.0, xs[0] - dx / 2,
+                                0.0, dy, ys[0] - dy / 2)
+        self.height, self.width = self._array.shape
+        # The name identifies the data in a `RasterCache`, so it includes
+        # the selection along any other dimensions
+        self.filename = filename
+        self.name = 'NETCDF:"{}":{}'.format(filename, variable)
+        if indexers:
+            self.name += '[{}]'.format(', '.join(
+                '{}={!r}'.format(key, indexers[key])
+                for key in sorted(indexers)))
+
+    def read_window(self, bounds, band=1):
+        row_start, row_stop, col_start, col_stop = bounds
+        window = self._array[row_start:row_stop, col_start:col_stop]
+        return np.asarray(window.values, dtype=np.float64)
+
+    def close(self):
+        self._dataset.close()
+
+
+def _read(dataset, bounds, band=1):
+    r"""Read a window of a raster band as floating-point numbers, with
+    missing values replaced by NaN"""
+    if isinstance(dataset, GriddedSource):
+        return dataset.read_window(bounds, band)
+
+    from rasterio.windows import Window
+
+    row_start, row_stop, col_start, col_stop = bounds
+    window = Window(col_start, row_start,
+                    col_stop - col_start, row_stop - row_start)
+    data = dataset.read(indexes=band, window=window, masked=True)
+    return data.astype(np.float64).filled(np.nan)
+
+
+class RasterCache(object):
+    r"""Cache of decoded tiles of raster data sets
+
+    Decoding compressed rasters is often more expensive than interpolating
+    from them. This object splits rasters into square tiles and keeps the
+    ones that were decoded most recently in memory, up to a given total
+    size, so that interpolating several times from the same data set over
+    overlapping regions only decodes each tile once. Tiles are keyed by the
+    name, shape, and georeferencing of the data set, the band, and the
+    position of the tile. Data sets that aren't backed by a file can't be
+    checked for changes, so a cache shouldn't be used for them if their
+    contents can change. When averaging over the cells of a mesh, the cache
+    also keeps the index of the cell that contains each pixel, which counts
+    towards the same total size as the tiles.
+
+    Optionally, decoded tiles can also be written to a directory on disk, so
+    that other processes or later runs can memory-map them rather than
+    decoding them again. This is only done for data sets that are backed by
+    a file; the key then includes the modification time and size of the
+    file so that stale tiles are never used.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        The largest total size of the tiles and pixel indices kept in memory
+        on each process
+    tile_size : int, optional
+        The number of rows and columns of each tile
+    directory : str, optional
+        A directory for the on-disk cache; if not given, tiles are only
+        cached in memory
+    """
+    def __init__(self, max_bytes=64 * 2**20, tile_size=512, directory=None):
+        self.max_bytes = max_bytes
+        self.tile_size = tile_size
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size(self):
+        r"""The total size in bytes of the tiles and pixel indices kept in
+        memory"""
+        return self._size
+
+    def clear(self):
+        r"""Remove all of the tiles and pixel indices from memory; tiles on
+        disk are kept"""
+        self._entries.clear()
+        self._size = 0
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, value, nbytes):
+        self._entries[key] = (value, nbytes)
+        self._size += nbytes
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            evicted = self._entries.popitem(last=False)[1]
+            self._size -= evicted[1]
+
+    def _source_key(self, dataset):
+        name = dataset.name
+        geometry = '{}x{}:{}'.format(dataset.height, dataset.width,
+                                     tuple(dataset.transform))
+        filename = getattr(dataset, 'filename', None) or name
+        if filename.startswith('/vsi') or not os.path.isfile(filename):
+            return '{}:{}'.format(name, geometry), False
+
+        status = os.stat(filename)
+        key = '{}:{}:{}:{}'.format(os.path.abspath(filename),
+                                   status.st_mtime_ns, status.st_size,
+                                   geometry)
+        if name != filename:
+            key += ':' + name
+        return key, True
+
+    def _tile(self, dataset, band, tile_row, tile_col):
+        source_key, is_file = self._source_key(dataset)
+        key = (source_key, band, tile_row, tile_col)
+        tile = self._get(key)
+        if tile is not None:
+            self.hits += 1
+            return tile
+
+        self.misses += 1
+        T = self.tile_size
+        bounds = (tile_row * T, min((tile_row + 1) * T, dataset.height),
+                  tile_col * T, min((tile_col + 1) * T, dataset.width))
+
+        if self.directory is not None and is_file:
+            digest = hashlib.sha1(source_key.encode()).hexdigest()
+            filename = os.path.join(
+                self.directory, '{}-{}-{}-{}-{}.npy'.format(
+                    digest, band, T, tile_row, tile_col))
+            if not os.path.exists(filename):
+                temporary = '{}.{}.npy'.format(filename[:-4], os.getpid())
+                np.save(temporary, _read(dataset, bounds, band))
+                os.replace(temporary, filename)
+            tile = np.load(filename, mmap_mode='r')
+        else:
+            tile = _read(dataset, bounds, band)
+
+        self._put(key, tile, tile.nbytes)
+        return tile
+
+    def read(self, dataset, bounds, band=1):
+        r"""Return a window of a raster band as floating-point numbers, with
+        missing values replaced by NaN
+
+        Parameters
+        ----------
+        dataset : rasterio.DatasetReader or GriddedSource
+            The raster data set
+        bounds : tuple of int
+            The start and stop row and start and stop column of the window
+        band : int, optional
+            The band of the raster to read
+        """
+        row_start, row_stop, col_start, col_stop = bounds
+        T = self.tile_size
+        data = np.empty((row_stop - row_start, col_stop - col_start))
+        for tile_row in range(row_start // T, (row_stop - 1) // T + 1):
+            for tile_col in range(col_start // T, (col_stop - 1) // T + 1):
+                tile = self._tile(dataset, band, tile_row, tile_col)
+                r0, c0 = tile_row * T, tile_col * T
+                r1, r2 = max(row_start, r0), min(row_stop, r0 + tile.shape[0])
+                c1, c2 = max(col_start, c0), min(col_stop, c0 + tile.shape[1])
+                data[r1 - row_start:r2 - row_start,
+                     c1 - col_start:c2 - col_start] = \
+                    tile[r1 - r0:r2 - r0, c1 - c0:c2 - c0]
+
+        return data
+
+
+def _fill_missing(data, mask):
+    r"""Replace missing values with the value of the nearest valid pixel"""
+    if not mask.any() or mask.all():
+        return data
+
+    import scipy.ndimage
+    indices = scipy.ndimage.distance_transform_edt(
+        mask, return_distances=False, return_indices=True)
+    return data[tuple(indices)]
+
+
+def _shared_geometry(dataset, comm=None):
+    r"""Return the geometry of a raster, which is only read on the process
+    with rank 0 if a communicator is given"""
+    if comm is None:
+        return _geometry(dataset)
+    geometry = _geometry(dataset) if comm.rank == 0 else None
+    return comm.bcast(geometry, root=0)
+
+
+def _read_window(dataset, bounds, cache=None, comm=None):
+    r"""Read a window of a raster, or return None if the bounds are None
+
+    If a communicator is given, only the process with rank 0 reads from the
+    data set; every process sends it the bounds of the window it needs, and
+    it sends the windows back.
+    """
+    def read(bounds):
+        if bounds is None:
+            return None
+        if cache is not None:
+            return cache.read(dataset, bounds)
+        return _read(dataset, bounds)
+
+    if comm is None:
+        return read(bounds)
+
+    all_bounds = comm.gather(bounds, root=0)
+    windows = None
+    if comm.rank == 0:
+        windows = [read(b) for b in all_bounds]
+    return comm.scatter(windows, root=0)
+
+
+def _sample(dataset, X, method, cache=None, comm=None):
+    r"""Interpolate the first band of a raster to an array of points"""
+    order = interpolation_orders[method]
+    geometry = _shared_geometry(dataset, comm)
+    rows, cols = _pixel_coordinates(geometry, X)
+
+    # Spline interpolation of order higher than 1 uses a global prefilter,
+    # so we need a wider margin around the points for boundary effects to
+    # decay
+    padding = 2 if order <= 1 else 8
+    bounds = None
+    if rows.size > 0:
+        bounds = _window_bounds(geometry, rows, cols, padding)
+
+    data = _read_window(dataset, bounds, cache, comm)
+    if rows.size == 0:
+        return np.zeros(0)
+
+    row_start, col_start = bounds[0], bounds[2]
+    mask = ~np.isfinite(data)
+    data = np.where(mask, 0.0, data)
+    if mask.all():
+        nodata = geometry.nodata if geometry.nodata is not None else np.nan
+        return np.full(rows.size, nodata, dtype=np.float64)
+
+    data = _fill_missing(data, mask)
+
+    # Importing scipy.ndimage is slow, so only do it when we're sampling
+    import scipy.ndimage
+    coordinates = np.vstack((rows - row_start, cols - col_start))
+    return scipy.ndimage.map_coordinates(data, coordinates, order=order,
+                                         mode='nearest')
+
+
+def _pixel_cells(mesh, geometry, cache=None):
+    r"""Return the window of a raster covering the cells of a triangular mesh
+    owned by this process, and the index of the cell containing each pixel
+    center of the window, or -1 for pixels outside the mesh
+
+    Locating the pixels is much more expensive than averaging over them, so
+    if a :class:`RasterCache` is given, the result is kept in it for each
+    mesh and raster geometry. The key includes a digest of the mesh
+    coordinates so that moving the mesh invalidates it.
+    """
+    import matplotlib.tri
+
+    coordinates = mesh.coordinates
+    X = coordinates.dat.data_ro_with_halos
+    cells = coordinates.cell_node_map().values
+
+    key = None
+    if cache is not None:
+        digest = hashlib.sha1(X.tobytes())
+        digest.update(cells.tobytes())
+        key = ('pixel cells', digest.hexdigest(), geometry.transform,
+               geometry.height, geometry.width)
+        value = cache._get(key)
+        if value is not None:
+            return value
+
+    bounds, index = None, np.zeros(0, dtype=np.int64)
+    if cells.shape[0] > 0:
+        rows, cols = _pixel_coordinates(geometry, X[cells.flatten()])
+        bounds = _window_bounds(geometry, rows, cols, padding=0)
+        row_start, row_stop, col_start, col_stop = bounds
+        pixel_rows, pixel_cols = np.mgrid[row_start:row_stop,
+                                          col_start:col_stop]
+        x, y = geometry.transform * (pixel_cols.flatten() + 0.5,
+                                     pixel_rows.flatten() + 0.5)
+
+        triangulation = matplotlib.tri.Triangulation(X[:, 0], X[:, 1], cells)
+        finder = triangulation.get_trifinder()
+        index = np.asarray(finder(np.asarray(x), np.asarray(y)),
+                           dtype=np.int64)
+
+    value = (bounds, index)
+    if cache is not None:
+        cache._put(key, value, index.nbytes)
+
+    return value
+
+
+def _average(dataset, mesh, cache=None, comm=None):
+    r"""Return the average of a raster over each cell of a mesh owned by this
+    process
+
+    The value in each cell is the mean of all the pixels whose centers lie
+    inside it. Cells that are too small to contain any pixel center take
+    the value at their centroid instead.
+    """
+    geometry = _shared_geometry(dataset, comm)
+    bounds, index = _pixel_cells(mesh, geometry, cache)
+    data = _read_window(dataset, bounds, cache, comm)
+
+    cells = mesh.coordinates.cell_node_map().values
+    num_cells = cells.shape[0]
+    sums, counts = np.zeros(num_cells), np.zeros(num_cells)
+    if bounds is not None:
+        data = data.flatten()
+        valid = (index >= 0) & np.isfinite(data)
+        sums = np.bincount(index[valid], weights=data[valid],
+                           minlength=num_cells)
+        counts = np.bincount(index[valid], minlength=num_cells)
+
+    means = np.zeros(num_cells)
+    nonempty = counts > 0
+    means[nonempty] = sums[nonempty] / counts[nonempty]
+
+    # Every process has to sample the centroids, even if it has no empty
+    # cells, in case the raster is only being read on one of them
+    X = mesh.coordinates.dat.data_ro_with_halos
+    centroids = X[cells[~nonempty]].mean(axis=1)
+    means[~nonempty] = _sample(dataset, centroids, 'linear', cache, comm)
+    return means
+
+
+def interpolate(f, Q, method='linear', cache=None, root_reader=False):
     r"""Interpolate an expression or a gridded data set to a function space
 
+    For gridded data sets, this function reads only the window of the raster
+    that covers the nodes of the mesh, and only once, and then interpolates
+    the values at the pixel centers to all of the nodes at once. Missing
+    values are filled in from the nearest valid pixel. Points outside the
+    raster don't get the `nodata` value; they take the value of the nearest
+    pixel along the edge of the raster instead.
+
+    Sampling at the nodes aliases data with a much finer resolution than the
+    mesh. The ``'average'`` method instead takes the mean of all the pixels
+    in each triangle and then projects this piecewise-constant field onto
+    `Q`, which gives a smooth field that conserves the integral of the data
+    over each cell, at least when `Q` contains piecewise constants.
+
+    When run in parallel, each process only reads the window of the raster
+    that covers the nodes that it owns. Alternatively, a single process can
+    read all of the windows and send them to the other processes, so that
+    only one of them accesses the file.
+
     Parameters
     ----------
-    f : rasterio dataset or tuple of rasterio datasets
+    f : rasterio dataset, GriddedSource, or tuple of either
         The gridded data set for scalar fields or the tuple of gridded data
         sets for each component
     Q : firedrake.FunctionSpace
         The function space where the result will live
+    method : str, optional
+        The interpolation method for gridded data sets; either
+        ``'nearest'``, ``'linear'`` (the default), ``'cubic'``, or
+        ``'average'``
+    cache : RasterCache, optional
+        A cache of decoded raster tiles to share between calls, which is
+        worthwhile when interpolating from the same data set many times;
+        with the ``'average'`` method, it also keeps which cell each pixel
+        lies in. By default, the window is read directly from the data set
+        and nothing is kept in memory afterwards
+    root_reader : bool, optional
+        If True, only the process with rank 0 reads from the data sets; the
+        data sets are ignored on the other processes and may be None
 
     Returns
     -------
@@ -38,27 +546,80 @@ def interpolate(f, Q):
     if isinstance(f, (ufl.core.expr.Expr, firedrake.Function)):
         return firedrake.interpolate(f, Q)
 
+    methods = list(interpolation_orders) + ['average']
+    if method not in methods:
+        raise ValueError('Interpolation method must be one of {}!'
+                         .format(methods))
+
     mesh = Q.mesh()
+    if method == 'average' and mesh.ufl_cell() != ufl.triangle:
+        raise ValueError('Averaging is only implemented on triangular '
+                         'meshes!')
+
+    # Importing rasterio is slow, so only do it when we're given a data set
+    import rasterio
+
+    shape = Q.ufl_element().value_shape()
+    comm = mesh.comm if root_reader else None
+
+    gridded_types = (rasterio.DatasetReader, GriddedSource)
+    if isinstance(f, gridded_types):
+        datasets = (f,)
+    elif (isinstance(f, tuple) and
+          all(isinstance(fi, gridded_types) for fi in f)):
+        datasets = f
+    else:
+        datasets = None
+
+    num_components = shape[0] if shape else 1
+    error = None
+    if datasets is None:
+        error = 'Argument must be a gridded data set or a tuple of data sets!'
+    elif len(datasets) != num_components:
+        error = ('Got {} data sets for a function space with {} components!'
+                 .format(len(datasets), num_components))
+
+    if comm is not None:
+        # Only the arguments on the root process matter, so every process
+        # takes its verdict and its number of data sets; otherwise an error
+        # or a mismatch could leave the others waiting forever
+        count = len(datasets) if error is None else 0
+        error, count = comm.bcast((error, count), root=0)
+        if comm.rank != 0:
+            datasets = (None,) * count
+
+    if error is not None:
+        raise ValueError(error)
+
+    if method == 'average':
+        if shape:
+            Q0 = firedrake.VectorFunctionSpace(mesh, 'DG', 0, dim=shape[0])
+        else:
+            Q0 = firedrake.FunctionSpace(mesh, 'DG', 0)
+        q0 = firedrake.Function(Q0)
+        dofs = Q0.cell_node_map().values[:, 0]
+        for i, dataset in enumerate(datasets):
+            values = _average(dataset, mesh, cache, comm)
+            if shape:
+                q0.dat.data[dofs, i] = values
+            else:
+                q0.dat.data[dofs] = values
+
+        return firedrake.project(q0, Q)
+
     element = Q.ufl_element()
     if len(element.sub_elements()) > 0:
         element = element.sub_elements()[0]
 
     V = firedrake.VectorFunctionSpace(mesh, element)
     X = firedrake.interpolate(mesh.coordinates, V).dat.data_ro
-    num_points = X.shape[0]
 
     q = firedrake.Function(Q)
-
-    if isinstance(f, rasterio.DatasetReader):
-        q.dat.data[:] = np.fromiter(f.sample(X, indexes=1),
-                                    dtype=np.float64, count=num_points)
-    elif (isinstance(f, tuple) and
-          all(isinstance(fi, rasterio.DatasetReader) for fi in f)):
-        for i, fi in enumerate(f):
-            q.dat.data[:, i] = np.fromiter(fi.sample(X, indexes=1),
-                                           dtype=np.float64, count=num_points)
-    else:
-        raise ValueError('Argument must be a rasterio data set or a tuple of '
-                         'data sets!')
+    for i, dataset in enumerate(datasets):
+        values = _sample(dataset, X, method, cache, comm)
+        if shape:
+            q.dat.data[:, i] = values
+        else:
+            q.dat.data[:] = values
 
     return q
@@ -180,9 +180,17 @@ class InverseSolver(object):
 
         # Create the derivative of the objective functional
         self._dE = derivative(self._E, self._u)
-        dR = derivative(self._R, self._p)
+        self._dR = dR
+        self._dF_dp = dF_dp
         self._dJ = (action(adjoint(dF_dp), self._λ) + dR)
 
+        # The linearized model and the mass matrix are assembled and factored
+        # once and then reused for every solve until they change
+        self._dF_du_matrix = None
+        self._dF_du_solver = None
+        self._num_linearizations = 0
+        self._mass_solver = None
+
     @property
     def problem(self):
         r"""The instance of the inverse problem we're solving"""
@@ -234,10 +242,56 @@ class InverseSolver(object):
         args = self._model_args
         return method(model, **args, **{self.problem.parameter_name: p})
 
+    @property
+    def num_linearizations(self):
+        r"""The number of times that the linearization of the model physics
+        around the current state has been assembled and factored"""
+        return self._num_linearizations
+
     def _assemble(self, *args, **kwargs):
         return firedrake.assemble(*args, **kwargs,
                                   form_compiler_parameters=self._fc_params)
 
+    def _linear_solver(self, A, bcs=None):
+        matrix = self._assemble(A, bcs=bcs)
+        return firedrake.LinearSolver(matrix,
+                                      solver_parameters=self._solver_params)
+
+    def _update_linearization(self):
+        r"""Assemble and factor the derivative of the model physics with
+        respect to the state
+
+        The model physics are the derivative of an action functional, so
+        this operator is symmetric and the same factorization can be used
+        for both the tangent linear and the adjoint solves. The matrix and
+        the linear solver are created the first time and the matrix is
+        reassembled in place afterwards."""
+        if self._dF_du_solver is None:
+            self._dF_du_matrix = self._assemble(self._dF_du, bcs=self._bc)
+            self._dF_du_solver = firedrake.LinearSolver(
+                self._dF_du_matrix, solver_parameters=self._solver_params)
+        else:
+            self._assemble(self._dF_du, tensor=self._dF_du_matrix,
+                           bcs=self._bc)
+        self._num_linearizations += 1
+
+    def _solve_linearized(self, L):
+        r"""Solve the linearized model physics, or equivalently their
+        adjoint, with the right-hand side `L`"""
+        w = firedrake.Function(self.state.function_space())
+        self._dF_du_solver.solve(w, self._assemble(L))
+        return w
+
+    def _solve_mass(self, L, q):
+        r"""Solve a linear system with the mass matrix of the parameter
+        space, which is factored only once"""
+        if self._mass_solver is None:
+            Q = self.parameter.function_space()
+            M = firedrake.TrialFunction(Q) * firedrake.TestFunction(Q) * dx
+            self._mass_solver = self._linear_solver(M)
+
+        self._mass_solver.solve(q, self._assemble(L))
+
     def update_state(self):
         r"""Update the observable state for a new value of the parameters"""
         u, p = self.state, self.parameter
@@ -246,11 +300,8 @@ class InverseSolver(object):
     def update_adjoint_state(self):
         r"""Update the adjoint state for new values of the observable state and
         parameters so that we can calculate derivatives"""
-        λ = self.adjoint_state
-        L = adjoint(self._dF_du)
-        firedrake.solve(L == -self._dE, λ, self._bc,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
+        self._update_linearization()
+        self.adjoint_state.assign(self._solve_linearized(-self._dE))
 
     def line_search(self):
         r"""Perform a line search along the descent direction to get a new
@@ -334,11 +385,7 @@ class GradientDescentSolver(InverseSolver):
         r"""Set the search direction to be the inverse of the mass matrix times
         the gradient of the objective"""
         q, dJ = self.search_direction, self.gradient
-        Q = q.function_space()
-        M = firedrake.TrialFunction(Q) * firedrake.TestFunction(Q) * dx
-        firedrake.solve(M == -dJ, q,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
+        self._solve_mass(-dJ, q)
 
 
 class GaussNewtonSolver(InverseSolver):
@@ -380,20 +427,10 @@ class GaussNewtonSolver(InverseSolver):
     def gauss_newton_mult(self, q):
         """Multiply a field by the Gauss-Newton operator"""
         u, p = self.state, self.parameter
+        dE, dR, dF_dp = self._dE, self._dR, self._dF_dp
 
-        dE = derivative(self._E, u)
-        dR = derivative(self._R, p)
-        dF_du, dF_dp = self._dF_du, derivative(self._F, p)
-
-        w = firedrake.Function(u.function_space())
-        firedrake.solve(dF_du == action(dF_dp, q), w, self._bc,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
-
-        v = firedrake.Function(u.function_space())
-        firedrake.solve(adjoint(dF_du) == derivative(dE, u, w), v, self._bc,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
+        w = self._solve_linearized(action(dF_dp, q))
+        v = self._solve_linearized(derivative(dE, u, w))
 
         return action(adjoint(dF_dp), v) + derivative(dR, p, q)
 
@@ -407,15 +444,9 @@ class GaussNewtonSolver(InverseSolver):
         search direction.
         """
         u, p = self.state, self.parameter
+        dE, dR, dF_dp = self._dE, self._dR, self._dF_dp
 
-        dE = derivative(self._E, u)
-        dR = derivative(self._R, p)
-        dF_du, dF_dp = self._dF_du, derivative(self._F, p)
-
-        v = firedrake.Function(u.function_space())
-        firedrake.solve(dF_du == action(dF_dp, q), v, self._bc,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
+        v = self._solve_linearized(action(dF_dp, q))
 
         return self._assemble(firedrake.energy_norm(derivative(dE, u), v) +
                               firedrake.energy_norm(derivative(dR, p), q))
@@ -425,16 +456,18 @@ class GaussNewtonSolver(InverseSolver):
         the preconditioned conjugate gradient method"""
         p, q, dJ = self.parameter, self.search_direction, self.gradient
 
-        dR = derivative(self.regularization, self.parameter)
+        dR = self._dR
         Q = q.function_space()
         M = firedrake.TrialFunction(Q) * firedrake.TestFunction(Q) * dx + \
             derivative(dR, p)
 
+        # The preconditioner only depends on the current parameter, so it's
+        # factored once for all of the conjugate gradient iterations
+        M_solver = self._linear_solver(M)
+
         # Compute the preconditioned residual
         z = firedrake.Function(Q)
-        firedrake.solve(M == -dJ, z,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
+        M_solver.solve(z, self._assemble(-dJ))
 
         # This variable is a search direction for a search direction, which
         # is definitely not confusing at all.
@@ -449,9 +482,7 @@ class GaussNewtonSolver(InverseSolver):
 
             δz = firedrake.Function(Q)
             g = self.gauss_newton_mult(s)
-            firedrake.solve(M == g, δz,
-                            solver_parameters=self._solver_params,
-                            form_compiler_parameters=self._fc_params)
+            M_solver.solve(δz, self._assemble(g))
 
             q += α * s
             z -= α * δz
@@ -488,14 +519,10 @@ class BFGSSolver(InverseSolver):
         self.update_state()
         self.update_adjoint_state()
 
-        Q = self.parameter.function_space()
         self._memory = memory
 
         q, dJ = self.search_direction, self.gradient
-        M = firedrake.TrialFunction(Q) * firedrake.TestFunction(Q) * dx
-        firedrake.solve(M == -dJ, q,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
+        self._solve_mass(-dJ, q)
 
         self._rho = []
         self._ps = [self.parameter.copy(deepcopy=True)]
@@ -519,11 +546,8 @@ class BFGSSolver(InverseSolver):
         2nd ed., algorithm 7.4."""
         p, q, dJ = self.parameter, self.search_direction, self.gradient
         Q = q.function_space()
-        M = firedrake.TrialFunction(Q) * firedrake.TestFunction(Q) * dx
         f = firedrake.Function(Q)
-        firedrake.solve(M == dJ, f,
-                        solver_parameters=self._solver_params,
-                        form_compiler_parameters=self._fc_params)
+        self._solve_mass(dJ, f)
 
         # Append the latest values of the parameters and the objective gradient
         # and compute the curvature factor
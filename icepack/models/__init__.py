@@ -10,8 +10,37 @@
 # The full text of the license can be found in the file LICENSE in the
 # icepack source directory or at <http://www.gnu.org/licenses/>.
 
-from icepack.models.ice_shelf import IceShelf
-from icepack.models.ice_stream import IceStream
-from icepack.models.hybrid import HybridModel
-from icepack.models.damage_transport import DamageTransport
-from icepack.models.heat_transport import HeatTransport3D
+import sys
+import importlib
+
+_submodules = ['damage_transport', 'friction', 'heat_transport', 'hybrid',
+               'ice_shelf', 'ice_stream', 'mass_transport', 'viscosity']
+
+_attributes = {
+    'IceShelf': 'icepack.models.ice_shelf',
+    'IceStream': 'icepack.models.ice_stream',
+    'HybridModel': 'icepack.models.hybrid',
+    'DamageTransport': 'icepack.models.damage_transport',
+    'HeatTransport3D': 'icepack.models.heat_transport'
+}
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module('icepack.models.' + name)
+    if name in _attributes:
+        value = getattr(importlib.import_module(_attributes[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        "module 'icepack.models' has no attribute '{}'".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules) | set(_attributes))
+
+
+# Module-level `__getattr__` is only supported from Python 3.7 on
+if sys.version_info < (3, 7):
+    for _name in _attributes:
+        __getattr__(_name)
@@ -22,9 +22,142 @@ from firedrake import (inner, grad, div, dx, ds, dS, sqrt, sym,
                        det, min_value, max_value, conditional)
 from icepack.models.viscosity import M
 from icepack.constants import year
+from icepack import utilities
 from icepack.utilities import eigenvalues
 
 
+class DamageSolver(object):
+    r"""Reusable solver for the damage transport equation
+
+    This object creates the forms for the stages of the Runge-Kutta method
+    and the expression for the damage sources and sinks once. The damage
+    field is discontinuous, so its mass matrix is block diagonal; its
+    inverse is computed cell by cell when the solver is created, and every
+    stage then costs only an assembly and a matrix-vector multiplication.
+    Calling `solve` assigns new values of the input fields in place to
+    internal copies and reuses all of them.
+
+    Parameters
+    ----------
+    model : DamageTransport
+        The damage model, which supplies the damage and healing parameters
+    dt : float
+        Timestep
+    D0 : firedrake.Function
+        Initial damage field
+    u : firedrake.Function
+        Ice velocity
+    A : firedrake.Function
+        Fluidity parameter
+    D_inflow : firedrake.Function, optional
+        Damage of the upstream ice that advects into the domain; if not
+        given, the initial damage is used
+    """
+    def __init__(self, model, dt, D0, u, A, D_inflow=None):
+        self._model = model
+        self._dt = firedrake.Constant(dt)
+        self._ε_h = firedrake.Constant(model.healing_strain_rate)
+        self._σ_d = firedrake.Constant(model.damage_stress)
+        self._γ_h = firedrake.Constant(model.healing_rate)
+        self._γ_d = firedrake.Constant(model.damage_rate)
+
+        fields = utilities.given_fields(
+            {'D0': D0, 'u': u, 'A': A, 'D_inflow': D_inflow})
+        self._fields = utilities.copy_fields(fields)
+        D0, u, A = self._fields['D0'], self._fields['u'], self._fields['A']
+        D_inflow = self._fields.get('D_inflow', D0)
+        dt = self._dt
+
+        Q = D0.function_space()
+        φ = firedrake.TestFunction(Q)
+        D = firedrake.Function(Q)
+
+        n = firedrake.FacetNormal(Q.mesh())
+
+        un = 0.5 * (inner(u, n) + abs(inner(u, n)))
+        L = dt * (D * div(φ * u) * dx
+                  - φ * max_value(inner(u, n), 0) * D * ds
+                  - φ * min_value(inner(u, n), 0) * D_inflow * ds
+                  - (φ('+') - φ('-')) * (un('+') * D('+') - un('-') * D('-')) * dS)
+        self._D1 = firedrake.Function(Q)
+        self._D2 = firedrake.Function(Q)
+        self._dq = firedrake.Function(Q)
+        self._rhs = firedrake.Function(Q)
+        self._mass_inverse = utilities.local_mass_inverse(Q)
+        self._num_mass_inverse_assemblies = 1
+        self._increments = [firedrake.replace(L, {D: D_k})
+                            for D_k in (D0, self._D1, self._D2)]
+
+        # Increase/decrease damage depending on stress and strain rates
+        self._D3 = firedrake.Function(Q)
+        ε = sym(grad(u))
+        ε_1 = eigenvalues(ε)[0]
+
+        σ = M(ε, A)
+        σ_e = sqrt(inner(σ, σ) - det(σ))
+
+        healing = self._γ_h * min_value(ε_1 - self._ε_h, 0)
+        fracture = (self._γ_d * conditional(σ_e - self._σ_d > 0, ε_1, 0.) *
+                    (1 - self._D3))
+
+        # Clamp damage field to [0, 1]
+        expr = min_value(max_value(self._D3 + dt * (healing + fracture), 0), 1)
+        self._D = firedrake.Function(Q)
+        self._interpolator = firedrake.Interpolator(expr, self._D)
+
+    @property
+    def num_mass_inverse_assemblies(self):
+        r"""The number of times the inverse of the mass matrix has been
+        assembled, which only depends on the function space"""
+        return self._num_mass_inverse_assemblies
+
+    def _increment(self, stage):
+        firedrake.assemble(self._increments[stage], tensor=self._rhs)
+        with self._rhs.dat.vec_ro as x, self._dq.dat.vec_wo as y:
+            self._mass_inverse.petscmat.mult(x, y)
+
+    def compatible(self, D0, u, A, D_inflow=None):
+        r"""Return whether this object can solve the problem with the given
+        inputs"""
+        fields = utilities.given_fields(
+            {'D0': D0, 'u': u, 'A': A, 'D_inflow': D_inflow})
+        return utilities.fields_compatible(self._fields, fields)
+
+    def solve(self, dt, D0, u, A, D_inflow=None):
+        r"""Propagate the damage forward by one timestep using new values of
+        the input fields
+
+        Returns
+        -------
+        D : firedrake.Function
+            Ice damage at `t + dt`
+        """
+        fields = utilities.given_fields(
+            {'D0': D0, 'u': u, 'A': A, 'D_inflow': D_inflow}, self._fields)
+
+        model = self._model
+        self._dt.assign(dt)
+        self._ε_h.assign(model.healing_strain_rate)
+        self._σ_d.assign(model.damage_stress)
+        self._γ_h.assign(model.healing_rate)
+        self._γ_d.assign(model.damage_rate)
+        utilities.update_fields(self._fields, fields)
+
+        # Three-stage strong structure-preserving Runge Kutta (SSPRK3) method
+        D, D1, D2, dq = self._fields['D0'], self._D1, self._D2, self._dq
+        self._increment(0)
+        D1.assign(D + dq)
+        self._increment(1)
+        D2.assign(0.75 * D + 0.25 * (D1 + dq))
+        self._increment(2)
+        self._D3.assign((1.0 / 3.0) * D + (2.0 / 3.0) * (D2 + dq))
+
+        # The damage field is discontinuous, so the sources, sinks, and
+        # clamping can be applied pointwise rather than with a projection
+        self._interpolator.interpolate()
+        return self._D.copy(deepcopy=True)
+
+
 class DamageTransport(object):
     def __init__(self, damage_stress=.07, damage_rate=.3,
                  healing_strain_rate=2e-10 * year, healing_rate=.1):
@@ -32,13 +165,16 @@ class DamageTransport(object):
         self.damage_rate = damage_rate
         self.healing_strain_rate = healing_strain_rate
         self.healing_rate = healing_rate
+        self._solver = None
 
     def solve(self, dt, D0, u, A, D_inflow=None, **kwargs):
         r"""Propogate the damage forward by one timestep
 
         This function uses a Runge-Kutta scheme to upwind damage
         (limiting damage diffusion) while sourcing and sinking
-        damage assocaited with crevasse opening/crevasse healing
+        damage assocaited with crevasse opening/crevasse healing.
+        The forms and solvers are created on the first call and
+        reused afterwards; see :class:`DamageSolver`.
 
         Parameters
         ----------
@@ -58,60 +194,9 @@ class DamageTransport(object):
         D : firedrake.Function
             Ice damage at `t + dt`
         """
+        solver = self._solver
+        if solver is None or not solver.compatible(D0, u, A, D_inflow):
+            solver = DamageSolver(self, dt, D0, u, A, D_inflow)
+            self._solver = solver
 
-        D_inflow = D_inflow if D_inflow is not None else D0
-        Q = D0.function_space()
-        dD, φ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
-        d = φ * dD * dx
-        D = D0.copy(deepcopy=True)
-
-        n = firedrake.FacetNormal(Q.mesh())
-
-        un = 0.5 * (inner(u, n) + abs(inner(u, n)))
-        L1 = dt * (D * div(φ * u) * dx
-                   - φ * max_value(inner(u, n), 0) * D * ds
-                   - φ * min_value(inner(u, n), 0) * D_inflow * ds
-                   - (φ('+') - φ('-')) * (un('+') * D('+') - un('-') * D('-')) * dS)
-        D1 = firedrake.Function(Q)
-        D2 = firedrake.Function(Q)
-        L2 = firedrake.replace(L1, {D: D1})
-        L3 = firedrake.replace(L1, {D: D2})
-
-        dq = firedrake.Function(Q)
-
-        # Three-stage strong structure-preserving Runge Kutta (SSPRK3) method
-        params = {
-            'ksp_type': 'preonly', 'pc_type': 'bjacobi', 'sub_pc_type': 'ilu'
-        }
-        prob1 = firedrake.LinearVariationalProblem(d, L1, dq)
-        solv1 = firedrake.LinearVariationalSolver(prob1, solver_parameters=params)
-        prob2 = firedrake.LinearVariationalProblem(d, L2, dq)
-        solv2 = firedrake.LinearVariationalSolver(prob2, solver_parameters=params)
-        prob3 = firedrake.LinearVariationalProblem(d, L3, dq)
-        solv3 = firedrake.LinearVariationalSolver(prob3, solver_parameters=params)
-
-        solv1.solve()
-        D1.assign(D + dq)
-        solv2.solve()
-        D2.assign(0.75 * D + 0.25 * (D1 + dq))
-        solv3.solve()
-        D.assign((1.0 / 3.0) * D + (2.0 / 3.0) * (D2 + dq))
-
-        # Increase/decrease damage depending on stress and strain rates
-        ε = sym(grad(u))
-        ε_1 = eigenvalues(ε)[0]
-
-        σ = M(ε, A)
-        σ_e = sqrt(inner(σ, σ) - det(σ))
-
-        ε_h = firedrake.Constant(self.healing_strain_rate)
-        σ_d = firedrake.Constant(self.damage_stress)
-        γ_h = firedrake.Constant(self.healing_rate)
-        γ_d = firedrake.Constant(self.damage_rate)
-
-        healing = γ_h * min_value(ε_1 - ε_h, 0)
-        fracture = γ_d * conditional(σ_e - σ_d > 0, ε_1, 0.) * (1 - D)
-
-        # Clamp damage field to [0, 1]
-        D.project(min_value(max_value(D + dt * (healing + fracture), 0), 1))
-        return D
+        return solver.solve(dt, D0, u, A, D_inflow)
@@ -15,8 +15,44 @@ from firedrake import inner, grad, div, dx, ds, ds_b, ds_t, ds_v
 from icepack.constants import (ice_density as ρ_I, thermal_diffusivity as α,
                                heat_capacity as c, latent_heat as L,
                                melting_temperature as Tm)
+from icepack import utilities
 from icepack.utilities import facet_normal_2, grad_2
 
+
+#: Default solver options for the diffusion step. Heat only diffuses
+#: vertically, so apart from the mass matrix, the system decouples into one
+#: small banded problem for each column of the extruded mesh. These options
+#: use the conjugate gradient method preconditioned with an additive Schwarz
+#: method whose blocks are the vertical lines of degrees of freedom above
+#: each entity of the footprint mesh. Each block is factored exactly, so the
+#: number of iterations only depends on the weak horizontal coupling through
+#: the mass matrix, and the cost grows linearly with the number of columns.
+#: Unless `pc_linesmooth_codims` is given, the entities are chosen from the
+#: function space.
+default_diffusion_solver_parameters = {
+    'ksp_type': 'cg',
+    'ksp_rtol': 1e-12,
+    'pc_type': 'python',
+    'pc_python_type': 'firedrake.ASMLinesmoothPC',
+    'pc_linesmooth_sub_ksp_type': 'preonly',
+    'pc_linesmooth_sub_pc_type': 'lu'
+}
+
+
+def _column_codims(Q):
+    r"""Return the codimensions of the entities of the footprint mesh that
+    have vertical columns of degrees of freedom attached to them
+
+    The entities of a tensor product element are indexed by pairs of the
+    horizontal and vertical dimensions, so the dimension of the footprint
+    cell is the largest horizontal one."""
+    entity_dofs = Q.finat_element.entity_dofs()
+    dimension = max(d_h for (d_h, d_v) in entity_dofs)
+    dims = set(d_h for (d_h, d_v), dofs in entity_dofs.items()
+               if any(len(ids) > 0 for ids in dofs.values()))
+    return ', '.join(str(dimension - d) for d in sorted(dims, reverse=True))
+
+
 class HeatTransport3D(object):
     r"""Class for modeling 3D heat transport
 
@@ -25,18 +61,24 @@ class HeatTransport3D(object):
     heat included in meltwater. We use the energy density rather than the
     enthalpy because it comes out to a nice round number (about 500 MPa/m^3)
     in the unit system we use.
-    """
-    def __init__(self):
-        pass
 
-    def _advect(self, dt, E, u, w, h, s, E_inflow, E_surface):
-        Q = E.function_space()
-        φ, ψ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
+    Parameters
+    ----------
+    diffusion_solver_parameters : dict, optional
+        PETSc options for the vertical diffusion step; defaults to the
+        column-wise solver in :data:`default_diffusion_solver_parameters`
+    """
+    def __init__(self, diffusion_solver_parameters=None):
+        if diffusion_solver_parameters is None:
+            diffusion_solver_parameters = default_diffusion_solver_parameters
+        self.diffusion_solver_parameters = diffusion_solver_parameters
+        self._solver = None
 
+    def _advection_forms(self, dt, φ, ψ, E, u, w, h, E_inflow, E_surface):
         U = firedrake.as_vector((u[0], u[1], w))
         flux_cells = -φ * inner(U, grad(ψ)) * h * dx
 
-        mesh = Q.mesh()
+        mesh = E.function_space().mesh()
         ν = facet_normal_2(mesh)
         outflow = firedrake.max_value(inner(u, ν), 0)
         inflow = firedrake.min_value(inner(u, ν), 0)
@@ -51,20 +93,15 @@ class HeatTransport3D(object):
                       -E_surface * ψ * firedrake.min_value(+w, 0) * h * ds_t
         A = E * ψ * h * dx + dt * flux_inflow
 
-        solver_parameters = {'ksp_type': 'preonly', 'pc_type': 'lu'}
         degree_E = E.ufl_element().degree()
         degree_u = u.ufl_element().degree()
         degree = (3 * degree_E[0] + degree_u[0],
                   2 * degree_E[1] + degree_u[1])
-        form_compiler_parameters = {'quadrature_degree': degree}
-        firedrake.solve(F == A, E,
-                        solver_parameters=solver_parameters,
-                        form_compiler_parameters=form_compiler_parameters)
+        return F, A, {'quadrature_degree': degree}
 
-    def _diffuse(self, dt, E, h, q, q_bed, E_surface):
+    def _diffusion_forms(self, dt, φ, ψ, E, h, q, q_bed, E_surface):
         Q = E.function_space()
         degree = Q.ufl_element().degree()[1]
-        φ, ψ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
 
         a = (h * φ * ψ + dt * α * φ.dx(2) * ψ.dx(2) / h) * dx \
             + degree**2 * dt * α * φ * ψ / h * ds_t
@@ -75,21 +112,52 @@ class HeatTransport3D(object):
 
         degree_E = E.ufl_element().degree()
         degree = (3 * degree_E[0], 2 * degree_E[1])
-        form_compiler_parameters = {'quadrature_degree': degree}
+        return a, f, {'quadrature_degree': degree}
+
+    def _diffusion_solver_parameters(self, Q):
+        solver_parameters = dict(self.diffusion_solver_parameters)
+        if (solver_parameters.get('pc_python_type') ==
+                'firedrake.ASMLinesmoothPC'):
+            solver_parameters.setdefault('pc_linesmooth_codims',
+                                         _column_codims(Q))
+        return solver_parameters
+
+    def _advect(self, dt, E, u, w, h, s, E_inflow, E_surface):
+        Q = E.function_space()
+        φ, ψ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
+        F, A, form_compiler_parameters = self._advection_forms(
+            dt, φ, ψ, E, u, w, h, E_inflow, E_surface)
+
+        solver_parameters = {'ksp_type': 'preonly', 'pc_type': 'lu'}
+        firedrake.solve(F == A, E,
+                        solver_parameters=solver_parameters,
+                        form_compiler_parameters=form_compiler_parameters)
+
+    def _diffuse(self, dt, E, h, q, q_bed, E_surface):
+        Q = E.function_space()
+        φ, ψ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
+        a, f, form_compiler_parameters = self._diffusion_forms(
+            dt, φ, ψ, E, h, q, q_bed, E_surface)
+
         firedrake.solve(a == f, E,
+                        solver_parameters=self._diffusion_solver_parameters(Q),
                         form_compiler_parameters=form_compiler_parameters)
 
     def solve(self, dt, E0, u, w, h, s, q, q_bed, E_inflow, E_surface):
-        r"""Propagate the energy density forward by one timestep"""
-        E_inflow = E_inflow if E_inflow is not None else E0
-        E_surface = E_surface if E_surface is not None else E0
-        E = E0.copy(deepcopy=True)
+        r"""Propagate the energy density forward by one timestep
 
-        dt = firedrake.Constant(dt)
-        self._advect(dt, E, u, w, h, s, E_inflow, E_surface)
-        self._diffuse(dt, E, h, q, q_bed, E_surface)
+        The forms and solvers are created on the first call and reused as
+        long as the inputs live in the same function spaces; see
+        :class:`HeatTransportSolver`.
+        """
+        solver = self._solver
+        fields = dict(E0=E0, u=u, w=w, h=h, s=s, q=q, q_bed=q_bed,
+                      E_inflow=E_inflow, E_surface=E_surface)
+        if solver is None or not solver.compatible(**fields):
+            solver = HeatTransportSolver(self, dt, **fields)
+            self._solver = solver
 
-        return E
+        return solver.solve(dt, **fields)
 
     def temperature(self, E):
         r"""Return the temperature of ice at the given energy density"""
@@ -103,3 +171,128 @@ class HeatTransport3D(object):
         r"""Return the energy density for ice at the given temperature and melt
         fraction"""
         return ρ_I * c * T + ρ_I * L * f
+
+
+class HeatTransportSolver(object):
+    r"""Reusable solver for the heat transport equation
+
+    This object creates the forms, matrices, and linear solvers for the
+    advection and diffusion steps once. Calling `solve` assigns new values
+    of the input fields in place to internal copies. The advection matrix
+    only depends on the timestep, velocity, and thickness, and the
+    diffusion matrix only on the timestep and thickness, so each of them
+    is only reassembled when those inputs have changed. In particular, the
+    factorization or preconditioner of the diffusion operator is reused
+    for as long as the thickness and timestep stay the same.
+
+    The parameters are the same as for :meth:`HeatTransport3D.solve`.
+    """
+    def __init__(self, model, dt, E0, u, w, h, s, q, q_bed, E_inflow=None,
+                 E_surface=None):
+        self._dt = firedrake.Constant(dt)
+        fields = utilities.given_fields(
+            {'E0': E0, 'u': u, 'w': w, 'h': h, 's': s, 'q': q,
+             'q_bed': q_bed, 'E_inflow': E_inflow, 'E_surface': E_surface})
+        self._fields = utilities.copy_fields(fields)
+        fields = self._fields
+        E0 = fields['E0']
+        E_inflow = fields.get('E_inflow', E0)
+        E_surface = fields.get('E_surface', E0)
+
+        Q = E0.function_space()
+        φ, ψ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
+        self._E = firedrake.Function(Q)
+        self._E_advected = firedrake.Function(Q)
+
+        F, A, params = model._advection_forms(
+            self._dt, φ, ψ, E0, fields['u'], fields['w'], fields['h'],
+            E_inflow, E_surface)
+        self._advection_forms = F, A, params
+        self._advection_matrix = firedrake.assemble(
+            F, form_compiler_parameters=params)
+        self._advection_rhs = firedrake.Function(Q)
+        self._advection_solver = firedrake.LinearSolver(
+            self._advection_matrix,
+            solver_parameters={'ksp_type': 'preonly', 'pc_type': 'lu'})
+
+        a, f, params = model._diffusion_forms(
+            self._dt, φ, ψ, self._E_advected, fields['h'], fields['q'],
+            fields['q_bed'], E_surface)
+        self._diffusion_forms = a, f, params
+        self._diffusion_matrix = firedrake.assemble(
+            a, form_compiler_parameters=params)
+        self._diffusion_rhs = firedrake.Function(Q)
+        self._diffusion_solver = firedrake.LinearSolver(
+            self._diffusion_matrix,
+            solver_parameters=model._diffusion_solver_parameters(Q))
+
+        self._num_advection_assemblies = 1
+        self._num_diffusion_assemblies = 1
+
+    @property
+    def fields(self):
+        r"""Dictionary of the input fields"""
+        return self._fields
+
+    @property
+    def num_advection_assemblies(self):
+        r"""The number of times the advection matrix has been assembled"""
+        return self._num_advection_assemblies
+
+    @property
+    def num_diffusion_assemblies(self):
+        r"""The number of times the diffusion matrix has been assembled"""
+        return self._num_diffusion_assemblies
+
+    def compatible(self, E0, u, w, h, s, q, q_bed, E_inflow=None,
+                   E_surface=None):
+        r"""Return whether this object can solve the problem with the given
+        inputs"""
+        fields = utilities.given_fields(
+            {'E0': E0, 'u': u, 'w': w, 'h': h, 's': s, 'q': q,
+             'q_bed': q_bed, 'E_inflow': E_inflow, 'E_surface': E_surface})
+        return utilities.fields_compatible(self._fields, fields)
+
+    def solve(self, dt, E0, u, w, h, s, q, q_bed, E_inflow=None,
+              E_surface=None):
+        r"""Propagate the energy density forward by one timestep using new
+        values of the input fields
+
+        Returns
+        -------
+        E : firedrake.Function
+            Energy density at `t + dt`
+        """
+        fields = utilities.given_fields(
+            {'E0': E0, 'u': u, 'w': w, 'h': h, 's': s, 'q': q,
+             'q_bed': q_bed, 'E_inflow': E_inflow, 'E_surface': E_surface},
+            self._fields)
+
+        dt_changed = float(dt) != float(self._dt)
+        thickness_changed = not utilities.fields_equal(
+            self._fields, {'h': h})
+        velocity_changed = not utilities.fields_equal(
+            self._fields, {'u': u, 'w': w})
+        self._dt.assign(dt)
+        utilities.update_fields(self._fields, fields)
+
+        F, A, params = self._advection_forms
+        if dt_changed or thickness_changed or velocity_changed:
+            firedrake.assemble(F, tensor=self._advection_matrix,
+                               form_compiler_parameters=params)
+            self._num_advection_assemblies += 1
+        firedrake.assemble(A, tensor=self._advection_rhs,
+                           form_compiler_parameters=params)
+        self._advection_solver.solve(self._E_advected, self._advection_rhs)
+
+        a, f, params = self._diffusion_forms
+        if dt_changed or thickness_changed:
+            firedrake.assemble(a, tensor=self._diffusion_matrix,
+                               form_compiler_parameters=params)
+            self._num_diffusion_assemblies += 1
+        firedrake.assemble(f, tensor=self._diffusion_rhs,
+                           form_compiler_parameters=params)
+        self._E.assign(self._E_advected)
+        self._diffusion_solver.solve(self._E, self._diffusion_rhs)
+
+        return self._E.copy(deepcopy=True)
@@ -10,13 +10,14 @@
 # The full text of the license can be found in the file LICENSE in the
 # icepack source directory or at <http://www.gnu.org/licenses/>.
 
+import math
+import fractions
 import functools
-import sympy
 import firedrake
 from firedrake import (inner, outer, sym, Identity, tr as trace, sqrt,
                        grad, dx, ds, ds_b, ds_v)
 from icepack.models.mass_transport import LaxWendroff
-from icepack.optimization import newton_search
+from icepack.solvers import DiagnosticSolver
 from icepack.constants import (ice_density as ρ_I, water_density as ρ_W,
                                glen_flow_law as n, weertman_sliding_law as m,
                                gravity as g)
@@ -43,21 +44,66 @@ def gravity(u, h, s):
     return -ρ_I * g * inner(grad_2(s), u) * h * dx
 
 
-def _legendre(n, ζ):
-    return sympy.functions.special.polynomials.legendre(n, 2 * ζ - 1)
+def _legendre_coefficients(degree):
+    r"""Return the coefficients of the monomials :math:`1, \zeta, \ldots,
+    \zeta^d` in the Legendre polynomial of degree :math:`d` shifted to the
+    interval :math:`[0, 1]`"""
+    d = degree
+    return [(-1)**(d + k) * _binomial(d + k, k) * _binomial(d, k)
+            for k in range(d + 1)]
+
+
+def _binomial(total, k):
+    return (math.factorial(total) //
+            (math.factorial(k) * math.factorial(total - k)))
+
+
+def _horner(coefficients, x):
+    result = coefficients[-1]
+    for coefficient in reversed(coefficients[:-1]):
+        result = result * x + coefficient
+    return result
 
 
 @functools.lru_cache(maxsize=None)
+def _pressure_coefficients(N):
+    r"""Return the coefficients of the projection of the function
+    :math:`(\zeta_{\text{sl}} - \zeta)_+` onto polynomials in :math:`\zeta`
+    of degree less than `N`
+
+    The projection is a polynomial in both :math:`\zeta` and
+    :math:`\zeta_{\text{sl}}`. The coefficients are computed exactly in
+    rational arithmetic using the closed forms for the shifted Legendre
+    polynomials :math:`S_n`, which are orthogonal on :math:`[0, 1]` with
+    :math:`\int_0^1S_n^2d\zeta = 1 / (2n + 1)`, and
+
+    .. math::
+       \int_0^{\zeta_{\text{sl}}}(\zeta_{\text{sl}} - \zeta)\zeta^k d\zeta =
+       \frac{\zeta_{\text{sl}}^{k + 2}}{(k + 1)(k + 2)}.
+
+    The entry `(k, l)` of the result is the coefficient of
+    :math:`\zeta_{\text{sl}}^{k + 2}\zeta^l`.
+    """
+    P = [[fractions.Fraction(0)] * N for k in range(N)]
+    for degree in range(N):
+        a = _legendre_coefficients(degree)
+        for k in range(degree + 1):
+            weight = fractions.Fraction(2 * degree + 1, (k + 1) * (k + 2))
+            for l in range(degree + 1):
+                P[k][l] += weight * a[k] * a[l]
+
+    return tuple(tuple(float(P_kl) for P_kl in P_k) for P_k in P)
+
+
 def _pressure_approx(N):
-    ζ, ζ_sl = sympy.symbols('ζ ζ_sl', real=True, positive=True)
+    P = _pressure_coefficients(N)
 
-    def coefficient(n):
-        Sn = _legendre(n, ζ)
-        norm_square = sympy.integrate(Sn**2, (ζ, 0, 1))
-        return sympy.integrate((ζ_sl - ζ) * Sn, (ζ, 0, ζ_sl)) / norm_square
+    def polynomial(ζ, ζ_sl):
+        coefficients = [_horner([P[k][l] for k in range(N)], ζ_sl)
+                        for l in range(N)]
+        return ζ_sl**2 * _horner(coefficients, ζ)
 
-    polynomial = sum([coefficient(n) * _legendre(n, ζ) for n in range(N)])
-    return sympy.lambdify((ζ, ζ_sl), sympy.simplify(polynomial))
+    return polynomial
 
 
 def terminus(u, h, s, ice_front_ids=()):
@@ -254,6 +300,7 @@ class HybridModel(object):
         self.gravity = add_kwarg_wrapper(gravity)
         self.terminus = add_kwarg_wrapper(terminus)
         self.penalty = add_kwarg_wrapper(normal_flow_penalty)
+        self._diagnostic_solver = None
 
     def action(self, u, h, s, **kwargs):
         r"""Return the action functional that gives the hybrid model as its
@@ -291,10 +338,17 @@ class HybridModel(object):
         return (3 * (xdegree_u - 1) + 2 * degree_h,
                 3 * max(zdegree_u - 1, 0) + zdegree_u + 1)
 
-    def diagnostic_solve(self, u0, h, s, dirichlet_ids, tol=1e-6, **kwargs):
+    def diagnostic_solve(self, u0, h, s, dirichlet_ids, tol=1e-6,
+                         solver_parameters='direct', inexact=False,
+                         callback=(lambda s: None), **kwargs):
         r"""Solve for the ice velocity from the thickness and surface
         elevation
 
+        The :class:`icepack.DiagnosticSolver` that does the work is kept by
+        the model and reused on the next call, as long as the solver
+        options are the same and the input fields live in the same function
+        spaces, so only the first call compiles the forms.
+
         Parameters
         ----------
         u0 : firedrake.Function
@@ -309,6 +363,17 @@ class HybridModel(object):
             Dirichlet boundary conditions should be applied
         tol : float
             dimensionless tolerance for when to terminate Newton's method
+        solver_parameters : str or dict, optional
+            The linear solver for each Newton step; either the name of one
+            of :data:`icepack.optimization.solver_configurations` or a dict
+            of PETSc options
+        inexact : bool, optional
+            Use an inexact Newton method where the linear solver tolerance
+            is adapted from the decrease of the nonlinear residual
+        callback : callable, optional
+            Function that will be called with the Newton solver object after
+            every iteration; its `statistics` attribute contains the
+            convergence history and timings so far
 
         Returns
         -------
@@ -322,24 +387,36 @@ class HybridModel(object):
             `viscosity`, `friction`, `gravity`, and `terminus` functions
             that were set when this model object was initialized
         """
-        u = u0.copy(deepcopy=True)
-
-        boundary_ids = u.ufl_domain().exterior_facets.unique_markers
-        side_wall_ids = kwargs.get('side_wall_ids', [])
-        kwargs['side_wall_ids'] = side_wall_ids
-        kwargs['ice_front_ids'] = list(
-            set(boundary_ids) - set(dirichlet_ids) - set(side_wall_ids))
-        bcs = firedrake.DirichletBC(
-            u.function_space(), firedrake.as_vector((0, 0)), dirichlet_ids)
-        params = {'quadrature_degree': self.quadrature_degree(u, h, **kwargs)}
-
-        action = self.action(u=u, h=h, s=s, **kwargs)
-        scale = self.scale(u=u, h=h, s=s, **kwargs)
-        return newton_search(action, u, bcs, tol, scale,
-                             form_compiler_parameters=params)
-
-    def prognostic_solve(self, dt, h0, a, u, **kwargs):
-        return self.mass_transport.solve(dt, h0=h0, a=a, u=u, **kwargs)
+        options = {'tol': tol, 'solver_parameters': solver_parameters,
+                   'inexact': inexact, 'callback': callback}
+        fields = dict(h=h, s=s, **kwargs)
+
+        solver = self._diagnostic_solver
+        if (solver is None or
+                not solver.compatible(u0, dirichlet_ids, **options, **fields)):
+            solver = DiagnosticSolver(self, u0, dirichlet_ids, **options,
+                                      **fields)
+            self._diagnostic_solver = solver
+
+        return solver.solve(u0=u0, **fields)
+
+    def prognostic_solve(self, dt, h0, a, u, h_inflow=None, u_end=None,
+                         courant_number=None):
+        r"""Propagate the ice thickness forward one timestep
+
+        See :meth:`icepack.models.mass_transport.LaxWendroff.solve`.
+
+        If either `u_end` or `courant_number` are given, the step is split
+        into several shorter ones that satisfy the CFL condition; see
+        :meth:`icepack.models.mass_transport.MassTransport.subcycle`
+        """
+        if u_end is None and courant_number is None:
+            return self.mass_transport.solve(dt, h0=h0, a=a, u=u,
+                                             h_inflow=h_inflow)
+
+        return self.mass_transport.subcycle(dt, h0=h0, a=a, u=u,
+                                            h_inflow=h_inflow, u_end=u_end,
+                                            courant_number=courant_number)
 
     def compute_surface(self, h, b):
         r"""Return the ice surface elevation consistent with a given
@@ -17,7 +17,7 @@ from icepack.constants import (ice_density as ρ_I, water_density as ρ_W,
 from icepack.models.viscosity import viscosity_depth_averaged as viscosity
 from icepack.models.friction import side_friction, normal_flow_penalty
 from icepack.models.mass_transport import LaxWendroff
-from icepack.optimization import newton_search
+from icepack.solvers import DiagnosticSolver
 from icepack.utilities import add_kwarg_wrapper
 
 
@@ -82,6 +82,7 @@ class IceShelf(object):
         self.penalty = add_kwarg_wrapper(penalty)
         self.gravity = add_kwarg_wrapper(gravity)
         self.terminus = add_kwarg_wrapper(terminus)
+        self._diagnostic_solver = None
 
     def action(self, u, h, **kwargs):
         r"""Return the action functional that gives the ice shelf diagnostic
@@ -144,9 +145,16 @@ class IceShelf(object):
         degree_h = h.ufl_element().degree()
         return 3 * (degree_u - 1) + 2 * degree_h
 
-    def diagnostic_solve(self, u0, h, dirichlet_ids, tol=1e-6, **kwargs):
+    def diagnostic_solve(self, u0, h, dirichlet_ids, tol=1e-6,
+                         solver_parameters='direct', inexact=False,
+                         callback=(lambda s: None), **kwargs):
         r"""Solve for the ice velocity from the thickness
 
+        The :class:`icepack.DiagnosticSolver` that does the work is kept by
+        the model and reused on the next call, as long as the solver
+        options are the same and the input fields live in the same function
+        spaces, so only the first call compiles the forms.
+
         Parameters
         ----------
         u0 : firedrake.Function
@@ -159,6 +167,17 @@ class IceShelf(object):
             Dirichlet conditions should be applied
         tol : float
             dimensionless tolerance for when to terminate Newton's method
+        solver_parameters : str or dict, optional
+            The linear solver for each Newton step; either the name of one
+            of :data:`icepack.optimization.solver_configurations` or a dict
+            of PETSc options
+        inexact : bool, optional
+            Use an inexact Newton method where the linear solver tolerance
+            is adapted from the decrease of the nonlinear residual
+        callback : callable, optional
+            Function that will be called with the Newton solver object after
+            every iteration; its `statistics` attribute contains the
+            convergence history and timings so far
 
         Returns
         -------
@@ -172,26 +191,33 @@ class IceShelf(object):
             `viscosity` and `gravity` functions that were set when this
             model object was initialized
         """
-        u = u0.copy(deepcopy=True)
-
-        boundary_ids = u.ufl_domain().exterior_facets.unique_markers
-        side_wall_ids = kwargs.get('side_wall_ids', [])
-        kwargs['side_wall_ids'] = side_wall_ids
-        kwargs['ice_front_ids'] = list(
-            set(boundary_ids) - set(dirichlet_ids) - set(side_wall_ids))
-        bcs = firedrake.DirichletBC(
-            u.function_space(), firedrake.as_vector((0, 0)), dirichlet_ids)
-        params = {'quadrature_degree': self.quadrature_degree(u, h, **kwargs)}
-
-        # Solve the nonlinear optimization problem
-        action = self.action(u=u, h=h, **kwargs)
-        scale = self.scale(u=u, h=h, **kwargs)
-        return newton_search(action, u, bcs, tol, scale,
-                             form_compiler_parameters=params)
-
-    def prognostic_solve(self, dt, h0, a, u, h_inflow=None):
+        options = {'tol': tol, 'solver_parameters': solver_parameters,
+                   'inexact': inexact, 'callback': callback}
+        fields = dict(h=h, **kwargs)
+
+        solver = self._diagnostic_solver
+        if (solver is None or
+                not solver.compatible(u0, dirichlet_ids, **options, **fields)):
+            solver = DiagnosticSolver(self, u0, dirichlet_ids, **options,
+                                      **fields)
+            self._diagnostic_solver = solver
+
+        return solver.solve(u0=u0, **fields)
+
+    def prognostic_solve(self, dt, h0, a, u, h_inflow=None, u_end=None,
+                         courant_number=None):
         r"""Propagate the ice thickness forward one timestep
 
-        See :meth:`icepack.models.mass_transport.MassTransport.solve`
+        See :meth:`icepack.models.mass_transport.MassTransport.solve`.
+
+        If either `u_end` or `courant_number` are given, the step is split
+        into several shorter ones that satisfy the CFL condition; see
+        :meth:`icepack.models.mass_transport.MassTransport.subcycle`
         """
-        return self.mass_transport.solve(dt, h0=h0, a=a, u=u, h_inflow=h_inflow)
+        if u_end is None and courant_number is None:
+            return self.mass_transport.solve(dt, h0=h0, a=a, u=u,
+                                             h_inflow=h_inflow)
+
+        return self.mass_transport.subcycle(dt, h0=h0, a=a, u=u,
+                                            h_inflow=h_inflow, u_end=u_end,
+                                            courant_number=courant_number)
@@ -18,7 +18,7 @@ from icepack.models.viscosity import viscosity_depth_averaged as viscosity
 from icepack.models.friction import (bed_friction, side_friction,
                                      normal_flow_penalty)
 from icepack.models.mass_transport import LaxWendroff
-from icepack.optimization import newton_search
+from icepack.solvers import DiagnosticSolver
 from icepack.utilities import add_kwarg_wrapper
 
 
@@ -98,6 +98,7 @@ class IceStream(object):
         self.penalty = add_kwarg_wrapper(penalty)
         self.gravity = add_kwarg_wrapper(gravity)
         self.terminus = add_kwarg_wrapper(terminus)
+        self._diagnostic_solver = None
 
     def action(self, u, h, s, **kwargs):
         r"""Return the action functional that gives the ice stream
@@ -134,10 +135,17 @@ class IceStream(object):
         degree_h = h.ufl_element().degree()
         return 3 * (degree_u - 1) + 2 * degree_h
 
-    def diagnostic_solve(self, u0, h, s, dirichlet_ids, tol=1e-6, **kwargs):
+    def diagnostic_solve(self, u0, h, s, dirichlet_ids, tol=1e-6,
+                         solver_parameters='direct', inexact=False,
+                         callback=(lambda s: None), **kwargs):
         r"""Solve for the ice velocity from the thickness and surface
         elevation
 
+        The :class:`icepack.DiagnosticSolver` that does the work is kept by
+        the model and reused on the next call, as long as the solver
+        options are the same and the input fields live in the same function
+        spaces, so only the first call compiles the forms.
+
         Parameters
         ----------
         u0 : firedrake.Function
@@ -152,6 +160,17 @@ class IceStream(object):
             Dirichlet boundary conditions should be applied
         tol : float
             dimensionless tolerance for when to terminate Newton's method
+        solver_parameters : str or dict, optional
+            The linear solver for each Newton step; either the name of one
+            of :data:`icepack.optimization.solver_configurations` or a dict
+            of PETSc options
+        inexact : bool, optional
+            Use an inexact Newton method where the linear solver tolerance
+            is adapted from the decrease of the nonlinear residual
+        callback : callable, optional
+            Function that will be called with the Newton solver object after
+            every iteration; its `statistics` attribute contains the
+            convergence history and timings so far
 
         Returns
         -------
@@ -165,28 +184,36 @@ class IceStream(object):
             `viscosity`, `friction`, `gravity`, and `terminus` functions
             that were set when this model object was initialized
         """
-        u = u0.copy(deepcopy=True)
-
-        boundary_ids = u.ufl_domain().exterior_facets.unique_markers
-        side_wall_ids = kwargs.get('side_wall_ids', [])
-        kwargs['side_wall_ids'] = side_wall_ids
-        kwargs['ice_front_ids'] = list(
-            set(boundary_ids) - set(dirichlet_ids) - set(side_wall_ids))
-        bcs = firedrake.DirichletBC(
-            u.function_space(), firedrake.as_vector((0, 0)), dirichlet_ids)
-        params = {'quadrature_degree': self.quadrature_degree(u, h, **kwargs)}
-
-        action = self.action(u=u, h=h, s=s, **kwargs)
-        scale = self.scale(u=u, h=h, s=s, **kwargs)
-        return newton_search(action, u, bcs, tol, scale,
-                             form_compiler_parameters=params)
-
-    def prognostic_solve(self, dt, h0, a, u, h_inflow=None):
+        options = {'tol': tol, 'solver_parameters': solver_parameters,
+                   'inexact': inexact, 'callback': callback}
+        fields = dict(h=h, s=s, **kwargs)
+
+        solver = self._diagnostic_solver
+        if (solver is None or
+                not solver.compatible(u0, dirichlet_ids, **options, **fields)):
+            solver = DiagnosticSolver(self, u0, dirichlet_ids, **options,
+                                      **fields)
+            self._diagnostic_solver = solver
+
+        return solver.solve(u0=u0, **fields)
+
+    def prognostic_solve(self, dt, h0, a, u, h_inflow=None, u_end=None,
+                         courant_number=None):
         r"""Propagate the ice thickness forward one timestep
 
-        See :meth:`icepack.models.mass_transport.ImplicitEuler.solve`
+        See :meth:`icepack.models.mass_transport.ImplicitEuler.solve`.
+
+        If either `u_end` or `courant_number` are given, the step is split
+        into several shorter ones that satisfy the CFL condition; see
+        :meth:`icepack.models.mass_transport.MassTransport.subcycle`
         """
-        return self.mass_transport.solve(dt, h0=h0, a=a, u=u, h_inflow=h_inflow)
+        if u_end is None and courant_number is None:
+            return self.mass_transport.solve(dt, h0=h0, a=a, u=u,
+                                             h_inflow=h_inflow)
+
+        return self.mass_transport.subcycle(dt, h0=h0, a=a, u=u,
+                                            h_inflow=h_inflow, u_end=u_end,
+                                            courant_number=courant_number)
 
     def compute_surface(self, h, b):
         r"""Return the ice surface elevation consistent with a given
@@ -19,11 +19,185 @@ grounded glaciers will also need to update the ice surface elevation in a
 manner consistent with the bed elevation and where the ice may go afloat.
 """
 
+import numpy as np
 import firedrake
 from firedrake import dx, inner
 from icepack import utilities
 
 
+class _TransportSolver(object):
+    r"""Base class for reusable solvers for the mass transport equation,
+    which keeps internal copies of the timestep and input fields that the
+    forms of the scheme are built from"""
+    def __init__(self, dt, h0, a, u, h_inflow=None):
+        self._dt = firedrake.Constant(dt)
+        fields = utilities.given_fields(
+            {'h0': h0, 'a': a, 'u': u, 'h_inflow': h_inflow})
+        self._fields = utilities.copy_fields(fields)
+
+    @property
+    def fields(self):
+        r"""Dictionary of the input fields to the scheme"""
+        return self._fields
+
+    def compatible(self, dt, h0, a, u, h_inflow=None):
+        r"""Return whether this object can solve the problem with the given
+        inputs, i.e. whether they are defined on the same function spaces as
+        the ones it was created with"""
+        fields = utilities.given_fields(
+            {'h0': h0, 'a': a, 'u': u, 'h_inflow': h_inflow})
+        return utilities.fields_compatible(self._fields, fields)
+
+    def _update(self, dt, h0, a, u, h_inflow=None):
+        fields = utilities.given_fields(
+            {'h0': h0, 'a': a, 'u': u, 'h_inflow': h_inflow}, self._fields)
+        self._dt.assign(dt)
+        utilities.update_fields(self._fields, fields)
+
+
+class MassTransportSolver(_TransportSolver):
+    r"""Reusable solver for one scheme for the mass transport equation
+
+    The mass transport schemes in this module are all linear in the new
+    thickness, so each timestep amounts to solving a linear system. This
+    object creates the bilinear and linear forms for the scheme, the matrix,
+    and the linear solver once. Calling `solve` with new input fields assigns
+    them in place to internal copies. The matrix depends only on the timestep
+    and the velocity, so when neither of them has changed since the last
+    call, only the right-hand side is reassembled and the factorization of
+    the matrix is reused.
+
+    Parameters
+    ----------
+    scheme : MassTransport
+        The timestepping scheme, e.g. :class:`ImplicitEuler` or
+        :class:`LaxWendroff`
+    dt : float
+        Timestep
+    h0 : firedrake.Function
+        Initial ice thickness
+    a : firedrake.Function
+        Sum of accumulation and melt rates
+    u : firedrake.Function
+        Ice velocity
+    h_inflow : firedrake.Function, optional
+        Thickness of the upstream ice that advects into the domain; if not
+        given, the initial thickness is used
+    solver_parameters : dict, optional
+        PETSc options for the linear solver; defaults to a direct solver
+    """
+    def __init__(self, scheme, dt, h0, a, u, h_inflow=None,
+                 solver_parameters=None):
+        super(MassTransportSolver, self).__init__(dt, h0, a, u, h_inflow)
+        h0 = self._fields['h0']
+        h_inflow = self._fields.get('h_inflow', h0)
+
+        Q = h0.function_space()
+        h, φ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
+        F, A = scheme._forms(self._dt, h, φ, h0, self._fields['a'],
+                             self._fields['u'], h_inflow)
+
+        self._F, self._A = F, A
+        self._matrix = firedrake.assemble(F)
+        self._rhs = firedrake.Function(Q)
+        self._h = h0.copy(deepcopy=True)
+
+        if solver_parameters is None:
+            solver_parameters = {'ksp_type': 'preonly', 'pc_type': 'lu'}
+        self._solver = firedrake.LinearSolver(
+            self._matrix, solver_parameters=solver_parameters)
+        self._num_matrix_assemblies = 1
+
+    @property
+    def num_matrix_assemblies(self):
+        r"""The number of times the matrix has been assembled"""
+        return self._num_matrix_assemblies
+
+    def solve(self, dt, h0, a, u, h_inflow=None):
+        r"""Propagate the thickness forward by one timestep using new values
+        of the input fields
+
+        Returns
+        -------
+        h : firedrake.Function
+            Ice thickness at `t + dt`
+        """
+        reassemble = (float(dt) != float(self._dt) or
+                      not utilities.fields_equal(self._fields, {'u': u}))
+        self._update(dt, h0, a, u, h_inflow)
+
+        if reassemble:
+            firedrake.assemble(self._F, tensor=self._matrix)
+            self._num_matrix_assemblies += 1
+        firedrake.assemble(self._A, tensor=self._rhs)
+
+        self._solver.solve(self._h, self._rhs)
+        return self._h.copy(deepcopy=True)
+
+
+class ExplicitTransportSolver(_TransportSolver):
+    r"""Reusable solver for explicit schemes for the mass transport equation
+
+    Explicit schemes on discontinuous function spaces only need to solve
+    with the mass matrix, which is block diagonal. This object computes the
+    inverse of the mass matrix cell by cell once, so that every stage of the
+    Runge-Kutta method costs only the assembly of the right-hand side and a
+    matrix-vector multiplication. The parameters are the same as for
+    :class:`MassTransportSolver`, except that there is no linear solver to
+    configure.
+    """
+    def __init__(self, scheme, dt, h0, a, u, h_inflow=None):
+        super(ExplicitTransportSolver, self).__init__(dt, h0, a, u, h_inflow)
+        h0 = self._fields['h0']
+        h_inflow = self._fields.get('h_inflow', h0)
+
+        Q = h0.function_space()
+        φ = firedrake.TestFunction(Q)
+        self._mass_inverse = utilities.local_mass_inverse(Q)
+        self._num_mass_inverse_assemblies = 1
+
+        h = firedrake.Function(Q)
+        self._h1 = firedrake.Function(Q)
+        self._h2 = firedrake.Function(Q)
+        L = scheme._increment(self._dt, h, φ, self._fields['a'],
+                              self._fields['u'], h_inflow)
+        self._increments = [firedrake.replace(L, {h: h_k})
+                            for h_k in (h0, self._h1, self._h2)]
+        self._rhs = firedrake.Function(Q)
+        self._δh = firedrake.Function(Q)
+
+    @property
+    def num_mass_inverse_assemblies(self):
+        r"""The number of times the inverse of the mass matrix has been
+        assembled, which only depends on the function space"""
+        return self._num_mass_inverse_assemblies
+
+    def _increment(self, stage):
+        firedrake.assemble(self._increments[stage], tensor=self._rhs)
+        with self._rhs.dat.vec_ro as x, self._δh.dat.vec_wo as y:
+            self._mass_inverse.petscmat.mult(x, y)
+        return self._δh
+
+    def solve(self, dt, h0, a, u, h_inflow=None):
+        r"""Propagate the thickness forward by one timestep using new values
+        of the input fields
+
+        Returns
+        -------
+        h : firedrake.Function
+            Ice thickness at `t + dt`
+        """
+        self._update(dt, h0, a, u, h_inflow)
+        h0, h1, h2 = self._fields['h0'], self._h1, self._h2
+
+        # Three-stage strong stability-preserving Runge-Kutta (SSPRK3) method
+        h1.assign(h0 + self._increment(0))
+        h2.assign(0.75 * h0 + 0.25 * (h1 + self._increment(1)))
+        h = h0.copy(deepcopy=True)
+        h.assign((1.0 / 3) * h0 + (2.0 / 3) * (h2 + self._increment(2)))
+        return h
+
+
 class MassTransport(object):
     def __init__(self, dimension):
         if dimension == 2:
@@ -31,14 +205,98 @@ class MassTransport(object):
             self.grad = firedrake.grad
             self.div = firedrake.div
             self.ds = firedrake.ds
+            self.dS = firedrake.dS
         elif dimension == 3:
             self.facet_normal = utilities.facet_normal_2
             self.grad = utilities.grad_2
             self.div = utilities.div_2
             self.ds = firedrake.ds_v
+            self.dS = firedrake.dS_v
         else:
             raise ValueError('Dimension must be 2 or 3!')
 
+        self._solver = None
+
+    def _forms(self, dt, h, φ, h0, a, u, h_inflow):
+        raise NotImplementedError()
+
+    def _create_solver(self, dt, h0, a, u, h_inflow=None):
+        return MassTransportSolver(self, dt, h0, a, u, h_inflow)
+
+    def _default_courant_number(self, Q):
+        r"""Return the Courant number used for sub-cycling if none is given;
+        the implicit schemes are stable for any timestep, but much larger
+        steps than this are inaccurate"""
+        return 0.5
+
+    def _solve(self, dt, h0, a, u, h_inflow=None):
+        solver = self._solver
+        if solver is None or not solver.compatible(dt, h0, a, u, h_inflow):
+            solver = self._create_solver(dt, h0, a, u, h_inflow)
+            self._solver = solver
+
+        return solver.solve(dt, h0, a, u, h_inflow)
+
+    def subcycle(self, dt, h0, a, u, h_inflow=None, u_end=None,
+                 courant_number=None):
+        r"""Propagate the thickness forward by a long timestep using several
+        shorter steps that satisfy the CFL condition
+
+        The velocity only needs to be updated at a much coarser rate than
+        the thickness does near fast-flowing outlets. This method splits the
+        interval `dt` into as many equal substeps as are necessary for the
+        Courant number of the velocity to be no more than the given value
+        in each one. The velocity is either held fixed at `u` or, if the
+        velocity `u_end` at the end of the interval is known, interpolated
+        linearly in time between the two. When the velocity is fixed, the
+        solver's matrix is reused for all of the substeps.
+
+        Parameters
+        ----------
+        dt : float
+            The total timestep
+        h0 : firedrake.Function
+            Initial ice thickness
+        a : firedrake.Function
+            Sum of accumulation and melt rates
+        u : firedrake.Function
+            Ice velocity at the start of the interval
+        h_inflow : firedrake.Function, optional
+            Thickness of the upstream ice that advects into the domain
+        u_end : firedrake.Function, optional
+            Ice velocity at the end of the interval
+        courant_number : float, optional
+            The largest Courant number allowed in each substep; by default,
+            a value that is safe for the scheme and the degree of `h0`
+
+        Returns
+        -------
+        h : firedrake.Function
+            Ice thickness at `t + dt`
+        """
+        if courant_number is None:
+            courant_number = self._default_courant_number(h0.function_space())
+
+        dt_max = utilities.courant_timestep(u, courant_number)
+        if u_end is not None:
+            dt_max = min(dt_max,
+                         utilities.courant_timestep(u_end, courant_number))
+        num_substeps = max(int(np.ceil(dt / dt_max)), 1)
+        δt = dt / num_substeps
+
+        v = u
+        if u_end is not None:
+            v = u.copy(deepcopy=True)
+
+        h = h0
+        for step in range(num_substeps):
+            if u_end is not None:
+                θ = (step + 0.5) / num_substeps
+                v.assign((1 - θ) * u + θ * u_end)
+            h = self.solve(δt, h0=h, a=a, u=v, h_inflow=h_inflow)
+
+        return h
+
 
 class ImplicitEuler(MassTransport):
     def __init__(self, dimension=2):
@@ -72,14 +330,12 @@ class ImplicitEuler(MassTransport):
         h : firedrake.Function
             Ice thickness at `t + dt`
         """
-        grad, ds = self.grad, self.ds
+        return self._solve(dt, h0, a, u, h_inflow)
 
-        h_inflow = h_inflow if h_inflow is not None else h0
-
-        Q = h0.function_space()
-        h, φ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
+    def _forms(self, dt, h, φ, h0, a, u, h_inflow):
+        grad, ds = self.grad, self.ds
 
-        n = self.facet_normal(Q.mesh())
+        n = self.facet_normal(h0.function_space().mesh())
         outflow = firedrake.max_value(inner(u, n), 0)
         inflow = firedrake.min_value(inner(u, n), 0)
 
@@ -91,11 +347,7 @@ class ImplicitEuler(MassTransport):
         flux_in = -h_inflow * φ * inflow * ds
         A = h0 * φ * dx + dt * (accumulation + flux_in)
 
-        h = h0.copy(deepcopy=True)
-        solver_parameters = {'ksp_type': 'preonly', 'pc_type': 'lu'}
-        firedrake.solve(F == A, h, solver_parameters=solver_parameters)
-
-        return h
+        return F, A
 
 
 class LaxWendroff(MassTransport):
@@ -127,14 +379,12 @@ class LaxWendroff(MassTransport):
         h : firedrake.Function
             Ice thickness at `t + dt`
         """
-        grad, div, ds = self.grad, self.div, self.ds
+        return self._solve(dt, h0, a, u, h_inflow)
 
-        h_inflow = h_inflow if h_inflow is not None else h0
-
-        Q = h0.function_space()
-        h, φ = firedrake.TrialFunction(Q), firedrake.TestFunction(Q)
+    def _forms(self, dt, h, φ, h0, a, u, h_inflow):
+        grad, div, ds = self.grad, self.div, self.ds
 
-        n = self.facet_normal(Q.mesh())
+        n = self.facet_normal(h0.function_space().mesh())
         outflow = firedrake.max_value(inner(u, n), 0)
         inflow = firedrake.min_value(inner(u, n), 0)
 
@@ -147,8 +397,69 @@ class LaxWendroff(MassTransport):
         flux_in = -(h_inflow - 0.5 * dt * div(h0 * u)) * φ * inflow * ds
         A = h0 * φ * dx + dt * (accumulation + flux_in)
 
-        h = h0.copy(deepcopy=True)
-        solver_parameters = {'ksp_type': 'preonly', 'pc_type': 'lu'}
-        firedrake.solve(F == A, h, solver_parameters=solver_parameters)
+        return F, A
 
-        return h
+
+class ExplicitUpwind(MassTransport):
+    def __init__(self, dimension=2):
+        super(ExplicitUpwind, self).__init__(dimension)
+
+    def solve(self, dt, h0, a, u, h_inflow=None):
+        r"""Propagate the thickness forward by one timestep
+
+        This function uses a discontinuous Galerkin discretization with
+        upwind fluxes and the explicit three-stage strong stability-
+        preserving Runge-Kutta method (SSPRK3). The thickness must live in
+        a discontinuous function space. The mass matrix is then block
+        diagonal and is inverted cell by cell, so unlike the implicit
+        schemes, each step requires no global linear solve. Since the scheme
+        is explicit, the timestep has to satisfy the CFL condition; see
+        :func:`icepack.utilities.courant_timestep`. For degree-:math:`p`
+        elements, a Courant number of :math:`1 / (2p + 1)` is safe.
+
+        Parameters
+        ----------
+        dt : float
+            Timestep
+        h0 : firedrake.Function
+            Initial ice thickness
+        a : firedrake.Function
+            Sum of accumulation and melt rates
+        u : firedrake.Function
+            Ice velocity
+        h_inflow : firedrake.Function
+            Thickness of the upstream ice that advects into the domain
+
+        Returns
+        -------
+        h : firedrake.Function
+            Ice thickness at `t + dt`
+        """
+        return self._solve(dt, h0, a, u, h_inflow)
+
+    def _create_solver(self, dt, h0, a, u, h_inflow=None):
+        return ExplicitTransportSolver(self, dt, h0, a, u, h_inflow)
+
+    def _default_courant_number(self, Q):
+        degree = Q.ufl_element().degree()
+        if isinstance(degree, tuple):
+            degree = max(degree)
+        return 1.0 / (2 * degree + 1)
+
+    def _increment(self, dt, h, φ, a, u, h_inflow):
+        grad, ds, dS = self.grad, self.ds, self.dS
+
+        n = self.facet_normal(h.function_space().mesh())
+        outflow = firedrake.max_value(inner(u, n), 0)
+        inflow = firedrake.min_value(inner(u, n), 0)
+        u_n = 0.5 * (inner(u, n) + abs(inner(u, n)))
+
+        flux_cells = h * inner(u, grad(φ)) * dx
+        flux_faces = ((φ('+') - φ('-')) *
+                      (u_n('+') * h('+') - u_n('-') * h('-')) * dS)
+        flux_out = h * φ * outflow * ds
+        flux_in = h_inflow * φ * inflow * ds
+        accumulation = a * φ * dx
+
+        return dt * (flux_cells - flux_faces - flux_out - flux_in +
+                     accumulation)
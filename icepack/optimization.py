@@ -10,14 +10,479 @@
 # The full text of the license can be found in the file LICENSE in the
 # icepack source directory or at <http://www.gnu.org/licenses/>.
 
+import time
+import contextlib
+import numpy as np
 import firedrake
+from pyop2.profiling import timed_region
+
+#: Named configurations of the linear solver for the Newton search direction
+#:
+#: The Hessian of the action functional is symmetric and positive-definite
+#: and its sparsity pattern never changes between Newton iterations, so
+#: there are several good choices for how to solve the linear systems.
+#:
+#: - ``direct``: LU factorization with MUMPS. Since the same matrix object
+#:   is reassembled in place at every iteration, PETSc only redoes the
+#:   numeric factorization and keeps the symbolic factorization and fill-
+#:   reducing ordering from the first iteration. Robust, but the memory
+#:   cost grows superlinearly with the problem size.
+#: - ``cg-gamg``: conjugate gradients preconditioned with PETSc's smoothed
+#:   aggregation algebraic multigrid.
+#: - ``cg-hypre``: conjugate gradients preconditioned with BoomerAMG from
+#:   hypre; requires that PETSc was built with hypre.
+#: - ``gmres-hypre``: GMRES preconditioned with BoomerAMG, for when the
+#:   preconditioner is not quite symmetric.
+#: - ``cg-block-gamg``: conjugate gradients with a block-diagonal
+#:   preconditioner, where each velocity component is preconditioned
+#:   separately using algebraic multigrid.
+solver_configurations = {
+    'direct': {
+        'ksp_type': 'preonly',
+        'pc_type': 'lu',
+        'pc_factor_mat_solver_type': 'mumps',
+        'pc_factor_reuse_ordering': True
+    },
+    'cg-gamg': {
+        'ksp_type': 'cg',
+        'ksp_rtol': 1e-10,
+        'pc_type': 'gamg'
+    },
+    'cg-hypre': {
+        'ksp_type': 'cg',
+        'ksp_rtol': 1e-10,
+        'pc_type': 'hypre',
+        'pc_hypre_type': 'boomeramg'
+    },
+    'gmres-hypre': {
+        'ksp_type': 'gmres',
+        'ksp_rtol': 1e-10,
+        'pc_type': 'hypre',
+        'pc_hypre_type': 'boomeramg'
+    },
+    'cg-block-gamg': {
+        'ksp_type': 'cg',
+        'ksp_rtol': 1e-10,
+        'pc_type': 'fieldsplit',
+        'pc_fieldsplit_type': 'additive',
+        'pc_fieldsplit_block_size': 2,
+        'fieldsplit_0_ksp_type': 'preonly',
+        'fieldsplit_0_pc_type': 'gamg',
+        'fieldsplit_1_ksp_type': 'preonly',
+        'fieldsplit_1_pc_type': 'gamg'
+    }
+}
+
+
+def get_solver_parameters(solver_parameters):
+    r"""Return a dictionary of PETSc options for the linear solver
+
+    Parameters
+    ----------
+    solver_parameters : str or dict
+        Either the name of one of the entries of `solver_configurations` or
+        a dictionary of PETSc options, which is returned unchanged
+
+    Raises
+    ------
+    ValueError
+        If the argument is not the name of a known solver configuration
+    """
+    if isinstance(solver_parameters, str):
+        try:
+            return dict(solver_configurations[solver_parameters])
+        except KeyError:
+            raise ValueError('Unknown solver configuration "{}"; must be one '
+                             'of {}'.format(solver_parameters,
+                                            sorted(solver_configurations)))
+
+    return solver_parameters
+
+
+def _armijo_search(E, E0, slope, armijo, contraction_factor,
+                   max_evaluations=50):
+    r"""Find a step length satisfying the Armijo condition for the function
+    `E` of the step length, starting from a trial step of 1
+
+    Returns the step length, the value of `E` there, and the number of
+    evaluations of `E`; see :meth:`NewtonSolver._line_search`.
+    """
+    α_min, α_max = 0.1, contraction_factor
+
+    def interpolated_step(α, Eα, α_old, Eα_old):
+        if not np.isfinite(Eα):
+            return None
+
+        d1 = Eα - E0 - slope * α
+        if α_old is None:
+            return -slope * α**2 / (2 * d1)
+
+        if not np.isfinite(Eα_old):
+            return None
+
+        d0 = Eα_old - E0 - slope * α_old
+        denom = α_old**2 * α**2 * (α - α_old)
+        a = (α_old**2 * d1 - α**2 * d0) / denom
+        b = (-α_old**3 * d1 + α**3 * d0) / denom
+        discriminant = b**2 - 3 * a * slope
+        if a == 0:
+            return -slope / (2 * b) if b != 0 else None
+        if discriminant >= 0:
+            return (-b + np.sqrt(discriminant)) / (3 * a)
+        return None
+
+    α, Eα = 1.0, E(1.0)
+    α_old, Eα_old = None, None
+    num_evaluations = 1
+    while not (Eα <= E0 + armijo * α * slope):
+        if num_evaluations >= max_evaluations:
+            raise firedrake.ConvergenceError(
+                'Line search failed to satisfy the Armijo condition after {} '
+                'evaluations'.format(num_evaluations))
+
+        α_new = interpolated_step(α, Eα, α_old, Eα_old)
+        if α_new is None or not np.isfinite(α_new):
+            α_new = contraction_factor * α
+        else:
+            α_new = min(max(α_new, α_min * α), α_max * α)
+
+        α_old, Eα_old = α, Eα
+        α, Eα = α_new, E(α_new)
+        num_evaluations += 1
+
+    return α, Eα, num_evaluations
+
+
+class NewtonStatistics(object):
+    r"""Convergence history and timing of one run of Newton's method
+
+    Attributes
+    ----------
+    iterations : int
+        The number of Newton steps taken
+    converged : bool
+        Whether the stopping criterion was satisfied, as opposed to hitting
+        the maximum number of iterations
+    residual_norms : list of float
+        The norm of the gradient of the objective at each iteration
+    slopes : list of float
+        The directional derivative of the objective along each search
+        direction; the Newton decrement is the negative of this value
+    scales : list of float
+        The value of the scale functional at each iteration
+    step_lengths : list of float
+        The step length accepted by the line search at each iteration
+    line_search_evaluations : list of int
+        The number of evaluations of the objective in each line search
+    linear_iterations : list of int
+        The number of Krylov iterations for each search direction
+    timings : dict
+        The total wall-clock time in seconds spent on assembly, the linear
+        solver, and the line search
+
+    The same phases are also logged as PETSc events, which will show up in
+    the output of ``-log_view``.
+    """
+    def __init__(self):
+        self.iterations = 0
+        self.converged = False
+        self.residual_norms = []
+        self.slopes = []
+        self.scales = []
+        self.step_lengths = []
+        self.line_search_evaluations = []
+        self.linear_iterations = []
+        self.timings = {'assembly': 0.0, 'linear_solve': 0.0,
+                        'line_search': 0.0}
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        r"""Time a phase of the solver and log it as a PETSc event"""
+        start = time.perf_counter()
+        with timed_region('icepack.newton.' + phase):
+            yield
+        self.timings[phase] += time.perf_counter() - start
+
+    def __repr__(self):
+        return ('NewtonStatistics(iterations={}, converged={}, '
+                'timings={})'.format(self.iterations, self.converged,
+                                     self.timings))
+
+
+class NewtonSolver(object):
+    r"""Reusable solver for minimizing a convex functional with Newton's method
+
+    This object creates the derivatives of the objective functional, the
+    line search functional, and the linear solver for the Newton search
+    direction once when it is initialized. Calling `solve` repeatedly will
+    reuse all of these, so the input fields to the objective can be updated
+    in place and the problem solved again without paying the setup cost.
+
+    Parameters
+    ----------
+    E : firedrake.Form
+        The functional to be minimized
+    u : firedrake.Function
+        Initial guess for the minimizer; this function is updated in place
+    bc : firedrake.DirichletBC
+        Boundary conditions for the search direction
+    tolerance : float
+        Stopping criterion for the optimization procedure
+    scale : firedrake.Form
+        A positive scale functional by which to measure the objective
+    max_iterations : int, optional
+        Optimization procedure will stop at this many iterations regardless
+        of convergence
+    armijo : float, optional
+        The constant in the Armijo condition (see Nocedal and Wright)
+    contraction_factor : float, optional
+        The largest fraction of the current step length to try next in the
+        line search if the Armijo condition is not satisfied; the next step
+        length is chosen by polynomial interpolation within this bound
+    form_compiler_parameters : dict, optional
+        Extra options to pass to the firedrake form compiler
+    solver_parameters : str or dict, optional
+        Either the name of one of the `solver_configurations` or a dict of
+        options to pass to the linear solver
+    inexact : bool, optional
+        If True, solve for each search direction only as accurately as is
+        warranted by the decrease of the nonlinear residual, using the
+        forcing terms of Eisenstat and Walker. This only has an effect with
+        an iterative linear solver, e.g. ``'cg-gamg'``.
+    forcing_parameters : dict, optional
+        The constants ``gamma``, ``alpha`` and ``eta_max`` in the Eisenstat-
+        Walker forcing term; see "Choosing the forcing terms in an inexact
+        Newton method", SIAM J. Sci. Comput. (1996)
+    callback : callable, optional
+        A function that will be called with this solver object as its
+        argument after every Newton step; the convergence history so far is
+        in the `statistics` attribute
+    """
+    def __init__(self, E, u, bc, tolerance, scale,
+                 max_iterations=50, armijo=1e-4, contraction_factor=0.5,
+                 form_compiler_parameters={},
+                 solver_parameters='direct',
+                 inexact=False, forcing_parameters={},
+                 callback=(lambda s: None)):
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.armijo = armijo
+        self.contraction_factor = contraction_factor
+        self._form_compiler_parameters = form_compiler_parameters
+
+        self._E = E
+        self._u = u
+        self._scale = scale
+        self._bcs = [] if bc is None else (
+            list(bc) if isinstance(bc, (list, tuple)) else [bc])
+
+        # The Hessian matrix and the negative gradient are assembled in place
+        # at every iteration. The gradient is reused to compute the slope
+        # along the search direction and, for the inexact method, the
+        # residual norm, so neither requires another pass over the mesh.
+        F = firedrake.derivative(E, u)
+        self._H = firedrake.derivative(F, u)
+        self._minus_F = -F
+        self._A = self._assemble(self._H, bcs=self._bcs)
+        self._rhs = firedrake.Function(u.function_space())
+        self._v = firedrake.Function(u.function_space())
+        self._search_direction_solver = firedrake.LinearSolver(
+            self._A, solver_parameters=get_solver_parameters(solver_parameters))
+
+        self._α = firedrake.Constant(1)
+        self._Eα = firedrake.replace(E, {u: u + self._α * self._v})
+
+        self.inexact = inexact
+        self._forcing_parameters = dict(
+            {'gamma': 0.9, 'alpha': 2.0, 'eta_max': 0.5}, **forcing_parameters)
+        self._callback = callback
+        self._statistics = NewtonStatistics()
+
+    def _assemble(self, *args, **kwargs):
+        return firedrake.assemble(*args, **kwargs,
+            form_compiler_parameters=self._form_compiler_parameters)
+
+    @property
+    def solution(self):
+        r"""The current guess for the minimizer"""
+        return self._u
+
+    @property
+    def search_direction(self):
+        r"""The most recently computed Newton search direction"""
+        return self._v
+
+    @property
+    def statistics(self):
+        r"""The convergence history and timings of the last call to
+        `solve`; see :class:`NewtonStatistics`"""
+        return self._statistics
+
+    @property
+    def line_search_evaluations(self):
+        r"""The number of evaluations of the objective functional that the
+        line search needed at each step of the last call to `solve`"""
+        return self._statistics.line_search_evaluations
+
+    def _assemble_system(self):
+        r"""Assemble the Hessian and the negative gradient of the objective
+        in place and return the norm of the gradient"""
+        self._assemble(self._H, tensor=self._A, bcs=self._bcs)
+        self._assemble(self._minus_F, tensor=self._rhs)
+        for bc in self._bcs:
+            bc.apply(self._rhs)
+
+        with self._rhs.dat.vec_ro as rhs:
+            return rhs.norm()
+
+    def _forcing_term(self, η, residual, residual_old):
+        r"""Return the relative tolerance for the next linear solve using
+        choice 2 of Eisenstat and Walker, with their safeguard against the
+        tolerance decreasing too quickly"""
+        γ = self._forcing_parameters['gamma']
+        α = self._forcing_parameters['alpha']
+        η_max = self._forcing_parameters['eta_max']
+
+        η_new = γ * (residual / residual_old)**α
+        η_safe = γ * η**α
+        if η_safe > 0.1:
+            η_new = max(η_new, η_safe)
+        return min(η_new, η_max)
+
+    def _line_search(self, E0, slope):
+        r"""Find a step length satisfying the Armijo condition
+
+        The first trial step is always the full Newton step. If that fails,
+        the next trial step minimizes the quadratic interpolant of the
+        objective value and slope at 0 and the value at the trial step;
+        after that, we use the cubic interpolant of the values at 0 and at
+        the last two trial steps. See Nocedal and Wright, section 3.5. The
+        new step is always kept within a safeguarded fraction of the last
+        one, so the search can't stall or backtrack too slowly. If the
+        objective is infinite or undefined at a trial step, the next step
+        is a fixed fraction of it.
+
+        Returns
+        -------
+        Eα : float
+            The value of the objective at the accepted step length, which
+            is stored in the constant `self._α`
+        num_evaluations : int
+            The number of evaluations of the objective functional
+        """
+        def E(t):
+            self._α.assign(t)
+            return self._assemble(self._Eα)
+
+        α, Eα, num_evaluations = _armijo_search(
+            E, E0, slope, self.armijo, self.contraction_factor)
+        self._α.assign(α)
+        return Eα, num_evaluations
+
+    def _search(self):
+        r"""Compute a search direction and return the directional
+        derivative of the objective along it"""
+        solver = self._search_direction_solver
+        ksp = solver.ksp
+        ksp.setOperators(self._A.petscmat)
+        with self._rhs.dat.vec_ro as rhs, self._v.dat.vec as v:
+            with solver.inserted_options():
+                ksp.solve(rhs, v)
+            slope = -rhs.dot(v)
+
+        reason = ksp.getConvergedReason()
+        if reason < 0:
+            raise firedrake.ConvergenceError(
+                'Linear solve for the Newton search direction failed to '
+                'converge; KSP reason: {}'.format(reason))
+
+        assert slope < 0
+        return slope
+
+    def solve(self):
+        r"""Run Newton's method starting from the current value of the
+        solution until the stopping criterion is satisfied
+
+        Returns
+        -------
+        int
+            The number of Newton iterations performed
+        """
+        E, u, v, α = self._E, self._u, self._v, self._α
+        stats = NewtonStatistics()
+        self._statistics = stats
+
+        ksp = self._search_direction_solver.ksp
+        rtol, atol, divtol, max_its = ksp.getTolerances()
+        η = self._forcing_parameters['eta_max']
+        residual_old = None
+        with stats.timed('assembly'):
+            E0 = self._assemble(E)
+
+        try:
+            while True:
+                with stats.timed('assembly'):
+                    residual = self._assemble_system()
+                stats.residual_norms.append(residual)
+
+                # Pick how accurately to solve for the search direction
+                if self.inexact:
+                    if residual_old is not None:
+                        η = self._forcing_term(η, residual, residual_old)
+                    residual_old = residual
+                    ksp.setTolerances(rtol=max(η, rtol))
+
+                # Compute a search direction and the directional derivative,
+                # check if we're done
+                with stats.timed('linear_solve'):
+                    slope = self._search()
+                    linear_iterations = ksp.getIterationNumber()
+                with stats.timed('assembly'):
+                    scale = self._assemble(self._scale)
+                converged = abs(slope) < scale * self.tolerance
+
+                # An inexact search direction can underestimate the Newton
+                # decrement, so confirm convergence with an accurate solve
+                if converged and self.inexact and η > rtol:
+                    η = rtol
+                    ksp.setTolerances(rtol=rtol)
+                    with stats.timed('linear_solve'):
+                        slope = self._search()
+                        linear_iterations += ksp.getIterationNumber()
+                    converged = abs(slope) < scale * self.tolerance
+
+                stats.slopes.append(slope)
+                stats.scales.append(scale)
+                stats.linear_iterations.append(linear_iterations)
+                if converged or (stats.iterations >= self.max_iterations):
+                    stats.converged = converged
+                    return stats.iterations
+
+                # Backtracking search; the objective at the accepted step is
+                # the starting value for the next iteration
+                with stats.timed('line_search'):
+                    E0, num_evaluations = self._line_search(E0, slope)
+                    u.assign(u + α * v)
+                stats.step_lengths.append(α.values()[0])
+                stats.line_search_evaluations.append(num_evaluations)
+
+                stats.iterations += 1
+                self._callback(self)
+        finally:
+            ksp.setTolerances(rtol=rtol)
+
 
 def newton_search(E, u, bc, tolerance, scale,
                   max_iterations=50, armijo=1e-4, contraction_factor=0.5,
                   form_compiler_parameters={},
-                  solver_parameters={'ksp_type': 'preonly', 'pc_type': 'lu'}):
+                  solver_parameters='direct', inexact=False):
     r"""Find the minimizer of a convex functional
 
+    This is a convenience wrapper that creates a :class:`NewtonSolver`,
+    runs it once, and throws it away. If you need to solve the same
+    problem many times with different input data, use a `NewtonSolver`
+    directly instead.
+
     Parameters
     ----------
     E : firedrake.Form
@@ -34,51 +499,28 @@ def newton_search(E, u, bc, tolerance, scale,
     armijo : float, optional
         The constant in the Armijo condition (see Nocedal and Wright)
     contraction_factor : float, optional
-        The amount by which to backtrack in the line search if the Armijo
-        condition is not satisfied
+        The largest fraction of the current step length to try next in the
+        line search if the Armijo condition is not satisfied; the next step
+        length is chosen by polynomial interpolation within this bound
     form_compiler_parameters : dict, optional
         Extra options to pass to the firedrake form compiler
-    solver_parameters : dict, optional
-        Extra options to pass to the linear solver
+    solver_parameters : str or dict, optional
+        Either the name of one of the `solver_configurations` or a dict of
+        options to pass to the linear solver
+    inexact : bool, optional
+        Whether to use an inexact Newton method with adaptive tolerances for
+        the linear solver; see :class:`NewtonSolver`
 
     Returns
     -------
     firedrake.Function
         The approximate minimizer of `E` to within tolerance
     """
-    F = firedrake.derivative(E, u)
-    H = firedrake.derivative(F, u)
-    v = firedrake.Function(u.function_space())
-    dE_dv = firedrake.action(F, v)
-
-    def assemble(*args, **kwargs):
-        return firedrake.assemble(
-            *args, **kwargs, form_compiler_parameters=form_compiler_parameters)
-
-    problem = firedrake.LinearVariationalProblem(H, -F, v, bc,
-                  form_compiler_parameters=form_compiler_parameters,
-                  constant_jacobian=False)
-    solver = firedrake.LinearVariationalSolver(problem,
-                 solver_parameters=solver_parameters)
-
-    n = 0
-    while True:
-        # Compute a search direction
-        solver.solve()
-
-        # Compute the directional derivative, check if we're done
-        slope = assemble(dE_dv)
-        assert slope < 0
-        if (abs(slope) < assemble(scale) * tolerance) or (n >= max_iterations):
-            return u
-
-        # Backtracking search
-        E0 = assemble(E)
-        α = firedrake.Constant(1)
-        Eα = firedrake.replace(E, {u: u + α * v})
-        while assemble(Eα) > E0 + armijo * α.values()[0] * slope:
-            α.assign(α * contraction_factor)
-
-        u.assign(u + α * v)
-        n += 1
-
+    solver = NewtonSolver(E, u, bc, tolerance, scale,
+                          max_iterations=max_iterations, armijo=armijo,
+                          contraction_factor=contraction_factor,
+                          form_compiler_parameters=form_compiler_parameters,
+                          solver_parameters=solver_parameters,
+                          inexact=inexact)
+    solver.solve()
+    return u
@@ -0,0 +1,391 @@
+# Copyright (C) 2020 by Daniel Shapero <shapero@uw.edu>
+#
+# This file is part of icepack.
+#
+# icepack is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The full text of the license can be found in the file LICENSE in the
+# icepack source directory or at <http://www.gnu.org/licenses/>.
+
+r"""Persistent solvers for the equations of glacier flow
+
+The `diagnostic_solve` methods of the glacier flow models create the action
+functional, its derivatives, the boundary conditions, and a linear solver
+from scratch every time they are called. The objects in this module create
+all of these once and reuse them, which is much cheaper when the same
+problem has to be solved many times with different input data, for example
+at every step of a prognostic simulation.
+
+This module also contains a solver that updates the thickness and velocity
+together as one nonlinear system, rather than alternating between the
+prognostic and diagnostic equations.
+"""
+
+import firedrake
+from icepack.constants import ice_density as ρ_I, water_density as ρ_W
+from icepack.optimization import NewtonSolver
+from icepack import utilities
+
+
+def _boundary_fields(u, dirichlet_ids, kwargs):
+    r"""Return a copy of the input fields to the diagnostic equations with
+    the side wall and ice front boundary IDs filled in"""
+    fields = dict(kwargs)
+    boundary_ids = u.ufl_domain().exterior_facets.unique_markers
+    side_wall_ids = fields.get('side_wall_ids', [])
+    fields['side_wall_ids'] = side_wall_ids
+    fields['ice_front_ids'] = list(
+        set(boundary_ids) - set(dirichlet_ids) - set(side_wall_ids))
+    return fields
+
+
+class DiagnosticSolver(object):
+    r"""Reusable solver for the diagnostic equations of a glacier flow model
+
+    This object creates the action functional, its derivatives, and the
+    Newton solver for the ice velocity once when it's initialized. Calling
+    `solve` with new values of the input fields assigns them in place to
+    internal copies, so that all of the compiled forms, the sparsity pattern
+    of the Newton matrix, and the linear solver are reused.
+
+    Parameters
+    ----------
+    model
+        The glacier flow model, e.g. :class:`icepack.models.IceShelf`,
+        :class:`icepack.models.IceStream`, or
+        :class:`icepack.models.HybridModel`
+    u0 : firedrake.Function
+        Initial guess for the ice velocity; the Dirichlet boundaries are
+        taken from `u0`
+    dirichlet_ids : list of int
+        list of integer IDs denoting the parts of the boundary where
+        Dirichlet conditions should be applied
+    tol : float
+        dimensionless tolerance for when to terminate Newton's method
+    solver_parameters : str or dict, optional
+        The linear solver for the Newton search direction; either the name
+        of one of :data:`icepack.optimization.solver_configurations`, e.g.
+        ``'direct'`` or ``'cg-gamg'``, or a dict of PETSc options
+    inexact : bool, optional
+        If True, use an inexact Newton method where the tolerance of the
+        linear solver is adapted to the decrease of the nonlinear residual;
+        only useful with an iterative linear solver
+    callback : callable, optional
+        A function that will be called with the
+        :class:`icepack.optimization.NewtonSolver` as its argument after
+        every Newton step, e.g. for logging convergence
+    predictor : icepack.timestepping.VelocityExtrapolator, optional
+        If present and `solve` is given the current time, the initial guess
+        for Newton's method is extrapolated from the velocities computed at
+        the previous times
+
+    Other parameters
+    ----------------
+    **kwargs
+        All other keyword arguments are the input fields (thickness,
+        surface elevation, fluidity, friction coefficient, etc.) and any
+        extra arguments to the model's action functional. Any functions and
+        constants are copied, and only those can be updated by subsequent
+        calls to `solve`.
+    """
+    def __init__(self, model, u0, dirichlet_ids, tol=1e-6,
+                 solver_parameters='direct', inexact=False,
+                 callback=(lambda s: None), predictor=None, **kwargs):
+        self._model = model
+        self._predictor = predictor
+        self._u = u0.copy(deepcopy=True)
+        u = self._u
+
+        self._options = {'dirichlet_ids': list(dirichlet_ids), 'tol': tol,
+                         'solver_parameters': solver_parameters,
+                         'inexact': inexact}
+        self._callback = callback
+        self._fields = utilities.copy_fields(
+            _boundary_fields(u, dirichlet_ids, kwargs))
+        fields = self._fields
+
+        bcs = firedrake.DirichletBC(
+            u.function_space(), firedrake.as_vector((0, 0)), dirichlet_ids)
+        params = {'quadrature_degree': model.quadrature_degree(u=u, **fields)}
+
+        action = model.action(u=u, **fields)
+        scale = model.scale(u=u, **fields)
+        self._newton_solver = NewtonSolver(
+            action, u, bcs, tol, scale,
+            form_compiler_parameters=params,
+            solver_parameters=solver_parameters,
+            inexact=inexact,
+            callback=callback)
+
+    @property
+    def model(self):
+        r"""The glacier flow model that this object solves"""
+        return self._model
+
+    @property
+    def velocity(self):
+        r"""The most recently computed ice velocity"""
+        return self._u
+
+    @property
+    def statistics(self):
+        r"""The iteration counts, convergence history, and timings of the
+        most recent solve; see :class:`icepack.optimization.NewtonStatistics`
+        """
+        return self._newton_solver.statistics
+
+    @property
+    def fields(self):
+        r"""Dictionary of the input fields to the diagnostic equations"""
+        return self._fields
+
+    def compatible(self, u0, dirichlet_ids, tol=1e-6,
+                   solver_parameters='direct', inexact=False,
+                   callback=(lambda s: None), predictor=None, **kwargs):
+        r"""Return whether this object can solve the problem with the given
+        arguments, i.e. whether the solver options are the same as the ones
+        it was created with and the input fields can be updated in place"""
+        options = {'dirichlet_ids': list(dirichlet_ids), 'tol': tol,
+                   'solver_parameters': solver_parameters,
+                   'inexact': inexact}
+        if (options != self._options or callback is not self._callback or
+                predictor is not self._predictor):
+            return False
+
+        if u0.function_space() != self._u.function_space():
+            return False
+
+        fields = _boundary_fields(u0, dirichlet_ids, kwargs)
+        return utilities.fields_compatible(self._fields, fields)
+
+    def solve(self, u0=None, time=None, **kwargs):
+        r"""Solve for the ice velocity using new values of the input fields
+
+        Parameters
+        ----------
+        u0 : firedrake.Function, optional
+            Initial guess for the ice velocity; if this is not provided,
+            Newton's method starts from the prediction of the velocity
+            extrapolator if there is one, or from the last computed velocity
+        time : float, optional
+            The current simulation time; this is only needed when using a
+            velocity extrapolator
+
+        Returns
+        -------
+        u : firedrake.Function
+            Ice velocity
+
+        Other parameters
+        ----------------
+        **kwargs
+            New values of any of the input fields that this solver was
+            created with
+        """
+        predictor = self._predictor if time is not None else None
+        if u0 is not None:
+            self._u.assign(u0)
+        elif predictor is not None:
+            predictor.predict(time, self._u)
+        utilities.update_fields(self._fields, kwargs)
+
+        self._newton_solver.solve()
+        if predictor is not None:
+            predictor.update(time, self._u)
+        return self._u.copy(deepcopy=True)
+
+
+#: Default PETSc options for the coupled solver: Newton's method with a
+#: backtracking line search and a direct solver for the linear systems
+coupled_solver_parameters = {
+    'snes_type': 'newtonls',
+    'snes_linesearch_type': 'bt',
+    'snes_max_it': 50,
+    'ksp_type': 'preonly',
+    'pc_type': 'lu',
+    'pc_factor_mat_solver_type': 'mumps'
+}
+
+
+class CoupledSolver(object):
+    r"""Solver that updates the ice thickness and velocity together
+
+    The usual way to run a prognostic simulation is to alternate between
+    updating the thickness with the velocity held fixed and updating the
+    velocity with the thickness held fixed. This operator splitting is only
+    stable for short timesteps, especially for thin and fast-flowing ice.
+    This object instead solves for the thickness at the end of the timestep
+    and the velocity consistent with it as one nonlinear system, which
+    allows much longer timesteps.
+
+    The system is built from the model's action functional, differentiated
+    with respect to the velocity, and the weak form of an implicit mass
+    transport scheme, and is solved with Newton's method. All of the forms
+    and the nonlinear solver are created once, so calling `solve` many times
+    is cheap.
+
+    Parameters
+    ----------
+    model
+        A depth-averaged glacier flow model, i.e.
+        :class:`icepack.models.IceShelf` or :class:`icepack.models.IceStream`
+    dt : float
+        Timestep
+    u0 : firedrake.Function
+        Initial ice velocity; the Dirichlet boundary values are taken from
+        this field
+    h0 : firedrake.Function
+        Initial ice thickness
+    a : firedrake.Function or firedrake.Constant
+        Sum of accumulation and melt rates
+    dirichlet_ids : list of int
+        IDs of the parts of the boundary where Dirichlet conditions are
+        applied to the velocity
+    h_inflow : firedrake.Function, optional
+        Thickness of the ice advecting into the domain; defaults to the
+        initial thickness
+    b : firedrake.Function, optional
+        The bed elevation; this has to be given for grounded ice, in which
+        case the surface elevation is computed from the thickness in the
+        same way as by `model.compute_surface`
+    mass_transport : optional
+        The mass transport scheme; defaults to the model's own scheme,
+        which has to be either :class:`ImplicitEuler` or
+        :class:`LaxWendroff`
+    tol : float, optional
+        Relative tolerance for Newton's method
+    solver_parameters : dict, optional
+        PETSc options for the nonlinear solver; defaults to
+        :data:`coupled_solver_parameters`
+
+    Other parameters
+    ----------------
+    **kwargs
+        All other keyword arguments are input fields to the model's action
+        functional, such as the fluidity and friction coefficient, or other
+        arguments such as `side_wall_ids`; functions and constants among them
+        can be updated by later calls to `solve`
+    """
+    def __init__(self, model, dt, u0, h0, a, dirichlet_ids, h_inflow=None,
+                 b=None, mass_transport=None, tol=1e-6,
+                 solver_parameters=None, **kwargs):
+        from icepack.models.mass_transport import ImplicitEuler, LaxWendroff
+
+        self._model = model
+        scheme = mass_transport or model.mass_transport
+        if not isinstance(scheme, (ImplicitEuler, LaxWendroff)):
+            raise ValueError('The coupled solver needs an implicit mass '
+                             'transport scheme!')
+
+        V, Q = u0.function_space(), h0.function_space()
+        W = Q * V
+        self._w = firedrake.Function(W)
+        self._w.sub(0).assign(h0)
+        self._w.sub(1).assign(u0)
+        self._dt = firedrake.Constant(dt)
+
+        boundary_ids = u0.ufl_domain().exterior_facets.unique_markers
+        side_wall_ids = kwargs.get('side_wall_ids', [])
+        kwargs['side_wall_ids'] = side_wall_ids
+        kwargs['ice_front_ids'] = list(
+            set(boundary_ids) - set(dirichlet_ids) - set(side_wall_ids))
+
+        fields = dict(h0=h0, a=a, **kwargs)
+        if h_inflow is not None:
+            fields['h_inflow'] = h_inflow
+        if b is not None:
+            fields['b'] = b
+        self._fields = utilities.copy_fields(fields)
+
+        inputs = {key: value for key, value in self._fields.items()
+                  if key not in ('h0', 'a', 'h_inflow', 'b')}
+        h0 = self._fields['h0']
+        h_inflow = self._fields.get('h_inflow', h0)
+
+        # Create the momentum balance with placeholder fields for the
+        # velocity, thickness, and surface, and then substitute the parts
+        # of the mixed function for them
+        h, u = firedrake.split(self._w)
+        φ, v = firedrake.TestFunctions(W)
+        u_, h_ = firedrake.Function(V), firedrake.Function(Q)
+        mapping = {u_: u, h_: h}
+        if b is not None:
+            s_ = firedrake.Function(Q)
+            inputs['s'] = s_
+            b = self._fields['b']
+            mapping[s_] = firedrake.max_value(h + b, (1 - ρ_I / ρ_W) * h)
+
+        action = model.action(u=u_, h=h_, **inputs)
+        F_u = firedrake.derivative(action, u_)
+        mapping[F_u.arguments()[0]] = v
+        F_u = firedrake.replace(F_u, mapping)
+        degree = model.quadrature_degree(u=u_, h=h_, **inputs)
+
+        F, A = scheme._forms(self._dt, h, φ, h0, self._fields['a'], u,
+                             h_inflow)
+        F_h = F - A
+
+        bcs = firedrake.DirichletBC(W.sub(1), u0.copy(deepcopy=True),
+                                    dirichlet_ids)
+        problem = firedrake.NonlinearVariationalProblem(
+            F_u + F_h, self._w, bcs,
+            form_compiler_parameters={'quadrature_degree': degree})
+
+        params = dict(coupled_solver_parameters)
+        params['snes_rtol'] = tol
+        params.update(solver_parameters or {})
+        self._solver = firedrake.NonlinearVariationalSolver(
+            problem, solver_parameters=params)
+
+    @property
+    def model(self):
+        r"""The glacier flow model that this object solves"""
+        return self._model
+
+    @property
+    def velocity(self):
+        r"""The most recently computed ice velocity"""
+        return self._w.sub(1)
+
+    @property
+    def thickness(self):
+        r"""The most recently computed ice thickness"""
+        return self._w.sub(0)
+
+    @property
+    def fields(self):
+        r"""Dictionary of the input fields"""
+        return self._fields
+
+    def solve(self, dt=None, **kwargs):
+        r"""Advance the thickness and velocity by one timestep
+
+        Parameters
+        ----------
+        dt : float, optional
+            The timestep; if not given, the last one is used again
+
+        Returns
+        -------
+        h, u : firedrake.Function
+            The ice thickness and velocity at the end of the timestep
+
+        Other parameters
+        ----------------
+        **kwargs
+            New values of any of the input fields that this solver was
+            created with; if `h0` is not given, the solver starts from the
+            thickness it computed last
+        """
+        if dt is not None:
+            self._dt.assign(dt)
+        utilities.update_fields(self._fields, kwargs)
+
+        self._solver.solve()
+        self._fields['h0'].assign(self._w.sub(0))
+
+        h, u = self._w.split()
+        return h.copy(deepcopy=True), u.copy(deepcopy=True)
@@ -0,0 +1,534 @@
+# Copyright (C) 2020 by Daniel Shapero <shapero@uw.edu>
+#
+# This file is part of icepack.
+#
+# icepack is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The full text of the license can be found in the file LICENSE in the
+# icepack source directory or at <http://www.gnu.org/licenses/>.
+
+r"""Helpers for time-dependent simulations that alternate between updating
+the ice thickness and solving for the ice velocity"""
+
+import numpy as np
+import firedrake
+from firedrake import inner
+from icepack.solvers import DiagnosticSolver
+from icepack.models.viscosity import rate_factor
+from icepack.models.hybrid import horizontal_strain, vertical_strain, stresses
+from icepack import utilities
+
+
+def _relative_change(f, f_ref):
+    r"""Return the largest change of a field from a reference value relative
+    to the largest magnitude of the reference, across all processes"""
+    data, data_ref = f.dat.data_ro, f_ref.dat.data_ro
+    local_change = np.max(np.abs(data - data_ref)) if data.size > 0 else 0.0
+    local_max = np.max(np.abs(data_ref)) if data.size > 0 else 0.0
+    change = f.comm.allreduce(local_change, op=max)
+    scale = f.comm.allreduce(local_max, op=max)
+    return change / scale if scale > 0 else change
+
+
+class VelocityExtrapolator(object):
+    r"""Predict the ice velocity at a new time by extrapolating from its
+    values at the last few times
+
+    In a prognostic simulation, the velocity changes only a little from one
+    timestep to the next. Using the previous velocity as the initial guess
+    for Newton's method is already good, but extrapolating a polynomial in
+    time through the last few velocities is usually better and costs only a
+    few vector operations.
+
+    Parameters
+    ----------
+    order : int, optional
+        The degree of the extrapolating polynomial; 0 uses the last
+        velocity, 1 extrapolates linearly and 2 quadratically. Until enough
+        velocities have been recorded, a lower degree is used.
+    """
+    def __init__(self, order=1):
+        if order < 0:
+            raise ValueError('Extrapolation order must be non-negative!')
+        self._order = order
+        self._times = []
+        self._velocities = []
+
+    @property
+    def order(self):
+        r"""The degree of the extrapolating polynomial"""
+        return self._order
+
+    def update(self, t, u):
+        r"""Record the velocity `u` computed at time `t`"""
+        if self._times and float(t) == self._times[-1]:
+            self._velocities[-1].assign(u)
+            return
+
+        if len(self._velocities) > self._order:
+            self._times.pop(0)
+            v = self._velocities.pop(0)
+            v.assign(u)
+        else:
+            v = u.copy(deepcopy=True)
+
+        self._times.append(float(t))
+        self._velocities.append(v)
+
+    def predict(self, t, u=None):
+        r"""Return the extrapolated velocity at time `t`
+
+        Parameters
+        ----------
+        t : float
+            The time at which to predict the velocity
+        u : firedrake.Function, optional
+            If present, the prediction is written into this function rather
+            than a new one
+
+        Returns
+        -------
+        firedrake.Function or None
+            The predicted velocity, or None if no velocities have been
+            recorded yet
+        """
+        if not self._velocities:
+            return None
+
+        ts, us = self._times, self._velocities
+        weights = []
+        for j, t_j in enumerate(ts):
+            w = 1.0
+            for k, t_k in enumerate(ts):
+                if k != j:
+                    w *= (t - t_k) / (t_j - t_k)
+            weights.append(w)
+
+        if u is None:
+            u = firedrake.Function(us[0].function_space())
+        u.assign(sum(w * u_j for w, u_j in zip(weights, us)))
+        return u
+
+
+class Simulation(object):
+    r"""Driver for simulations that alternate between updating the ice
+    thickness and solving for the ice velocity
+
+    This object owns the thickness, surface elevation, and velocity fields
+    and a persistent :class:`icepack.DiagnosticSolver` for the model. Each
+    step chooses the timestep adaptively so that the Courant number of the
+    current velocity is below a given value, moves the thickness forward
+    with the model's mass transport scheme, and then updates the velocity,
+    using an extrapolation of the velocities from the last few steps as the
+    initial guess. When the thickness has barely changed since the last
+    velocity solve, the solve is skipped altogether.
+
+    Parameters
+    ----------
+    model
+        The glacier flow model, e.g. :class:`icepack.models.IceShelf` or
+        :class:`icepack.models.IceStream`
+    u : firedrake.Function
+        The initial ice velocity; the Dirichlet boundary values are taken
+        from this field
+    h : firedrake.Function
+        The initial ice thickness
+    a : firedrake.Function or firedrake.Constant
+        The sum of accumulation and melt rates
+    dirichlet_ids : list of int
+        IDs of the parts of the boundary where Dirichlet conditions are
+        applied to the velocity
+    b : firedrake.Function, optional
+        The bed elevation; if present, the surface elevation is recomputed
+        from the thickness using the model's `compute_surface` method after
+        every step
+    h_inflow : firedrake.Function, optional
+        Thickness of the ice advecting into the domain; defaults to the
+        initial thickness
+    courant_number : float, optional
+        The timestep is chosen so that the Courant number of the velocity
+        is at most this value
+    transport_courant_number : float, optional
+        If present, each thickness update is sub-cycled with steps whose
+        Courant number is at most this value, so that the timestep and
+        hence the rate of velocity solves can be chosen with a much larger
+        `courant_number`; see
+        :meth:`icepack.models.mass_transport.MassTransport.subcycle`
+    dt_min, dt_max : float, optional
+        Bounds on the adaptive timestep
+    thickness_tolerance : float, optional
+        The velocity is only updated once the thickness has changed by more
+        than this fraction of its maximum value since the last velocity
+        solve; the default of 0 updates the velocity every step
+    extrapolation_order : int, optional
+        The order of the :class:`VelocityExtrapolator` used to predict the
+        initial guess for the velocity solves
+    tol : float, optional
+        Tolerance for the velocity solves
+    solver_parameters : str or dict, optional
+        Linear solver for the velocity solves
+
+    Other parameters
+    ----------------
+    **kwargs
+        All other arguments are input fields for the diagnostic model,
+        such as the fluidity and friction coefficient, or other arguments
+        such as `side_wall_ids`; see :class:`icepack.DiagnosticSolver`
+    """
+    def __init__(self, model, u, h, a, dirichlet_ids, b=None, h_inflow=None,
+                 courant_number=0.5, transport_courant_number=None,
+                 dt_min=0.0, dt_max=np.inf,
+                 thickness_tolerance=0.0, extrapolation_order=1, tol=1e-6,
+                 solver_parameters='direct', **kwargs):
+        self._model = model
+        self._time = 0.0
+        self._num_steps = 0
+        self._num_diagnostic_solves = 0
+
+        self.courant_number = courant_number
+        self.transport_courant_number = transport_courant_number
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.thickness_tolerance = thickness_tolerance
+
+        self._h = h.copy(deepcopy=True)
+        self._h_solved = h.copy(deepcopy=True)
+        self._a = a
+        self._b = b
+        if h_inflow is None:
+            h_inflow = h.copy(deepcopy=True)
+        self._h_inflow = h_inflow
+
+        fields = dict(h=self._h, **kwargs)
+        self._s = None
+        if b is not None:
+            self._s = model.compute_surface(h=self._h, b=b)
+            fields['s'] = self._s
+
+        self._predictor = VelocityExtrapolator(order=extrapolation_order)
+        self._diagnostic_solver = DiagnosticSolver(
+            model, u, dirichlet_ids, tol=tol,
+            solver_parameters=solver_parameters,
+            predictor=self._predictor, **fields)
+        self._u = self._diagnostic_solver.solve(time=self._time)
+        self._num_diagnostic_solves += 1
+
+    @property
+    def model(self):
+        r"""The glacier flow model"""
+        return self._model
+
+    @property
+    def time(self):
+        r"""The current simulation time"""
+        return self._time
+
+    @property
+    def num_steps(self):
+        r"""The number of timesteps taken so far"""
+        return self._num_steps
+
+    @property
+    def num_diagnostic_solves(self):
+        r"""The number of velocity solves performed so far"""
+        return self._num_diagnostic_solves
+
+    @property
+    def velocity(self):
+        r"""The current ice velocity"""
+        return self._u
+
+    @property
+    def thickness(self):
+        r"""The current ice thickness"""
+        return self._h
+
+    @property
+    def surface(self):
+        r"""The current ice surface elevation, if the bed was given"""
+        return self._s
+
+    @property
+    def diagnostic_solver(self):
+        r"""The solver object used for the ice velocity"""
+        return self._diagnostic_solver
+
+    def timestep(self):
+        r"""Return the timestep dictated by the Courant condition for the
+        current velocity and the bounds `dt_min` and `dt_max`"""
+        dt = utilities.courant_timestep(self._u, self.courant_number)
+        return min(max(dt, self.dt_min), self.dt_max)
+
+    def _relative_thickness_change(self):
+        return _relative_change(self._h, self._h_solved)
+
+    def step(self, dt=None):
+        r"""Advance the simulation by one timestep
+
+        Parameters
+        ----------
+        dt : float, optional
+            The timestep; if not given, it is chosen from the Courant
+            condition
+
+        Returns
+        -------
+        float
+            The timestep that was taken
+        """
+        dt = self.timestep() if dt is None else dt
+        model = self._model
+
+        h = model.prognostic_solve(dt, h0=self._h, a=self._a, u=self._u,
+                                   h_inflow=self._h_inflow,
+                                   courant_number=self.transport_courant_number)
+        self._h.assign(h)
+        if self._b is not None:
+            self._s.assign(model.compute_surface(h=self._h, b=self._b))
+
+        self._time += dt
+        self._num_steps += 1
+
+        if self._relative_thickness_change() > self.thickness_tolerance:
+            fields = {'h': self._h}
+            if self._s is not None:
+                fields['s'] = self._s
+            self._u = self._diagnostic_solver.solve(time=self._time, **fields)
+            self._h_solved.assign(self._h)
+            self._num_diagnostic_solves += 1
+
+        return dt
+
+    def run(self, final_time, callback=(lambda s: None)):
+        r"""Advance the simulation until the given final time
+
+        Parameters
+        ----------
+        final_time : float
+            The time at which to stop; the last step is shortened so that
+            the simulation ends exactly at this time
+        callback : callable, optional
+            A function that will be called with this object as its argument
+            after every step, e.g. to write output
+        """
+        while self._time < final_time:
+            dt = min(self.timestep(), final_time - self._time)
+            self.step(dt)
+            callback(self)
+
+
+class ThermomechanicalSimulation(object):
+    r"""Driver for simulations that couple ice flow to heat transport
+
+    This object owns the thickness, surface elevation, velocity, energy
+    density, and fluidity fields, and keeps persistent solvers for the
+    velocity, the thickness, and the energy density. The fluidity is
+    computed from the temperature of the ice and updated in place. Since the
+    fluidity changes slowly, it doesn't have to be recomputed at every
+    step; it can be refreshed every few steps, or whenever the energy
+    density has changed by more than some fraction since the last refresh.
+    In between, the velocity is computed with a lagged fluidity.
+
+    Parameters
+    ----------
+    model : icepack.models.HybridModel
+        The glacier flow model
+    heat_model : icepack.models.HeatTransport3D
+        The heat transport model
+    u : firedrake.Function
+        The initial ice velocity; the Dirichlet boundary values are taken
+        from this field
+    h : firedrake.Function
+        The initial ice thickness
+    b : firedrake.Function
+        The bed elevation
+    E : firedrake.Function
+        The initial energy density; the fluidity is defined on the same
+        function space
+    a : firedrake.Function or firedrake.Constant
+        The sum of accumulation and melt rates
+    dirichlet_ids : list of int
+        IDs of the parts of the boundary where Dirichlet conditions are
+        applied to the velocity
+    w : firedrake.Function or firedrake.Constant, optional
+        The vertical velocity in terrain-following coordinates; defaults to
+        zero
+    q_bed : firedrake.Function or firedrake.Constant, optional
+        The geothermal heat flux at the ice bed
+    E_inflow, E_surface : firedrake.Function, optional
+        The energy density of the ice advecting into the domain and at the
+        ice surface; both default to the initial energy density
+    h_inflow : firedrake.Function, optional
+        Thickness of the ice advecting into the domain; defaults to the
+        initial thickness
+    strain_heating : bool, optional
+        Whether to include the heat generated by viscous deformation
+    fluidity_update_interval : int, optional
+        Refresh the fluidity every this many steps; the default of 1
+        updates it at every step
+    fluidity_tolerance : float, optional
+        If present, the fluidity is also refreshed whenever the energy
+        density has changed by more than this fraction of its maximum value
+        since the last refresh
+    tol : float, optional
+        Tolerance for the velocity solves
+    solver_parameters : str or dict, optional
+        Linear solver for the velocity solves
+
+    Other parameters
+    ----------------
+    **kwargs
+        All other arguments are input fields for the diagnostic model, such
+        as the friction coefficient, or other arguments such as
+        `side_wall_ids`; see :class:`icepack.DiagnosticSolver`
+    """
+    def __init__(self, model, heat_model, u, h, b, E, a, dirichlet_ids,
+                 w=None, q_bed=firedrake.Constant(0), E_inflow=None,
+                 E_surface=None, h_inflow=None, strain_heating=True,
+                 fluidity_update_interval=1, fluidity_tolerance=None,
+                 tol=1e-6, solver_parameters='direct', **kwargs):
+        if fluidity_update_interval < 1:
+            raise ValueError('Fluidity update interval must be positive!')
+
+        self._model = model
+        self._heat_model = heat_model
+        self._time = 0.0
+        self._num_steps = 0
+        self._num_fluidity_updates = 0
+        self.fluidity_update_interval = fluidity_update_interval
+        self.fluidity_tolerance = fluidity_tolerance
+
+        self._h = h.copy(deepcopy=True)
+        self._b = b
+        self._s = model.compute_surface(h=self._h, b=b)
+        self._u = u.copy(deepcopy=True)
+        self._E = E.copy(deepcopy=True)
+        self._E_refreshed = E.copy(deepcopy=True)
+        self._a = a
+        self._w = w if w is not None else firedrake.Constant(0)
+        self._q_bed = q_bed
+        if E_inflow is None:
+            E_inflow = E.copy(deepcopy=True)
+        if E_surface is None:
+            E_surface = E.copy(deepcopy=True)
+        if h_inflow is None:
+            h_inflow = h.copy(deepcopy=True)
+        self._E_inflow = E_inflow
+        self._E_surface = E_surface
+        self._h_inflow = h_inflow
+
+        self._A = firedrake.Function(E.function_space())
+        expr = rate_factor(heat_model.temperature(self._E))
+        self._fluidity_interpolator = firedrake.Interpolator(expr, self._A)
+        self._update_fluidity()
+
+        if strain_heating:
+            ε_x = horizontal_strain(self._u, self._s, self._h)
+            ε_z = vertical_strain(self._u, self._h)
+            τ_x, τ_z = stresses(ε_x, ε_z, self._A)
+            self._q = inner(τ_x, ε_x) + inner(τ_z, ε_z)
+        else:
+            self._q = firedrake.Constant(0)
+
+        self._diagnostic_solver = DiagnosticSolver(
+            model, self._u, dirichlet_ids, tol=tol,
+            solver_parameters=solver_parameters,
+            h=self._h, s=self._s, A=self._A, **kwargs)
+        self._u.assign(self._diagnostic_solver.solve())
+
+    @property
+    def time(self):
+        r"""The current simulation time"""
+        return self._time
+
+    @property
+    def num_steps(self):
+        r"""The number of timesteps taken so far"""
+        return self._num_steps
+
+    @property
+    def num_fluidity_updates(self):
+        r"""The number of times the fluidity has been computed, including
+        the initial one"""
+        return self._num_fluidity_updates
+
+    @property
+    def velocity(self):
+        r"""The current ice velocity"""
+        return self._u
+
+    @property
+    def thickness(self):
+        r"""The current ice thickness"""
+        return self._h
+
+    @property
+    def surface(self):
+        r"""The current ice surface elevation"""
+        return self._s
+
+    @property
+    def energy_density(self):
+        r"""The current energy density"""
+        return self._E
+
+    @property
+    def fluidity(self):
+        r"""The fluidity computed at the last refresh"""
+        return self._A
+
+    def _update_fluidity(self):
+        self._fluidity_interpolator.interpolate()
+        self._E_refreshed.assign(self._E)
+        self._num_fluidity_updates += 1
+
+    def _relative_energy_change(self):
+        return _relative_change(self._E, self._E_refreshed)
+
+    def step(self, dt):
+        r"""Advance the simulation by one timestep"""
+        model, heat_model = self._model, self._heat_model
+
+        h = model.prognostic_solve(dt, h0=self._h, a=self._a, u=self._u,
+                                   h_inflow=self._h_inflow)
+        self._h.assign(h)
+        self._s.assign(model.compute_surface(h=self._h, b=self._b))
+
+        E = heat_model.solve(dt, E0=self._E, u=self._u, w=self._w, h=self._h,
+                             s=self._s, q=self._q, q_bed=self._q_bed,
+                             E_inflow=self._E_inflow,
+                             E_surface=self._E_surface)
+        self._E.assign(E)
+
+        self._time += dt
+        self._num_steps += 1
+
+        tolerance = self.fluidity_tolerance
+        if ((self._num_steps % self.fluidity_update_interval == 0) or
+                (tolerance is not None and
+                 self._relative_energy_change() > tolerance)):
+            self._update_fluidity()
+
+        u = self._diagnostic_solver.solve(h=self._h, s=self._s, A=self._A)
+        self._u.assign(u)
+
+    def run(self, final_time, dt, callback=(lambda s: None)):
+        r"""Advance the simulation until the given final time
+
+        Parameters
+        ----------
+        final_time : float
+            The time at which to stop; the last step is shortened so that
+            the simulation ends exactly at this time
+        dt : float
+            The timestep
+        callback : callable, optional
+            A function that will be called with this object as its argument
+            after every step, e.g. to write output
+        """
+        while self._time < final_time:
+            self.step(min(dt, final_time - self._time))
+            callback(self)
@@ -53,6 +53,59 @@ def diameter(mesh):
     return np.max(xmax - xmin)
 
 
+def courant_timestep(u, courant_number=1.0):
+    r"""Return the largest timestep for which the Courant number of a
+    velocity field is no more than the given value everywhere
+
+    The Courant number in each cell is the speed times the timestep divided
+    by the cell diameter. The speed is evaluated at the nodes of the
+    velocity field, so this estimate accounts for the variation of higher-
+    degree fields within each cell. The ratio is computed in the broken
+    version of the velocity space, so that a node shared by several cells
+    gets the value from each one of them rather than from whichever cell
+    was visited last, which matters on meshes with cells of very different
+    sizes. Only the first two components of the velocity are used, so this
+    also works for 3D velocity fields on extruded meshes where only the
+    horizontal velocity is stored.
+    """
+    mesh = u.ufl_domain()
+    element = firedrake.BrokenElement(u.ufl_element().sub_elements()[0])
+    Q = firedrake.FunctionSpace(mesh, element)
+    speed = sqrt(u[0]**2 + u[1]**2)
+    ratio = firedrake.interpolate(speed / firedrake.CellDiameter(mesh), Q)
+
+    data = ratio.dat.data_ro
+    local_max = np.max(data) if data.size > 0 else 0.0
+    max_ratio = mesh.comm.allreduce(local_max, op=max)
+    if max_ratio == 0:
+        return np.inf
+    return courant_number / max_ratio
+
+
+def local_mass_inverse(Q):
+    r"""Return the inverse of the mass matrix of a discontinuous function
+    space
+
+    The mass matrix of a discontinuous function space is block diagonal with
+    one block for each cell, so its inverse can be computed cell by cell
+    without any communication or global factorization. Multiplying by the
+    returned matrix then takes the place of a mass matrix solve.
+
+    Parameters
+    ----------
+    Q : firedrake.FunctionSpace
+        A discontinuous function space
+
+    Returns
+    -------
+    firedrake.matrix.Matrix
+        The assembled inverse mass matrix
+    """
+    φ, ψ = firedrake.TestFunction(Q), firedrake.TrialFunction(Q)
+    M = firedrake.Tensor(φ * ψ * firedrake.dx)
+    return firedrake.assemble(M.inv)
+
+
 def depth_average(q3d, weight=firedrake.Constant(1)):
     r"""Return the weighted depth average of a function on an extruded mesh"""
     element3d = q3d.ufl_element()
@@ -133,3 +186,131 @@ def add_kwarg_wrapper(func):
         return func(*args, **kwargs_)
 
     return wrapper
+
+
+def copy_fields(fields):
+    r"""Return a copy of a dictionary of input fields where every function and
+    constant has been replaced by a copy that can later be updated in place
+
+    Any other values, for example lists of boundary IDs or symbolic
+    expressions, are stored as-is.
+    """
+    copies = {}
+    for name, field in fields.items():
+        if isinstance(field, firedrake.Function):
+            copies[name] = field.copy(deepcopy=True)
+        elif isinstance(field, firedrake.Constant):
+            value = field.values().reshape(field.ufl_shape)
+            copies[name] = firedrake.Constant(value)
+        else:
+            copies[name] = field
+
+    return copies
+
+
+def _same_value(a, b):
+    if a is b:
+        return True
+    if isinstance(a, (int, float, str, list, tuple)) and type(a) == type(b):
+        return a == b
+    return False
+
+
+def given_fields(new_fields, fields=None):
+    r"""Return a dictionary of input fields without the optional ones that
+    were not given, i.e. whose value is None
+
+    Parameters
+    ----------
+    new_fields : dict
+        The input fields, including any optional ones
+    fields : dict, optional
+        A dictionary created by `copy_fields`; if given, the same optional
+        fields must have been given for both
+
+    Raises
+    ------
+    ValueError
+        If the names of the given fields don't match those of `fields`
+    """
+    result = dict((name, value) for name, value in new_fields.items()
+                  if value is not None)
+    if fields is not None and set(result) != set(fields):
+        names = sorted(set(result) ^ set(fields))
+        raise ValueError('Input fields {} must be given if and only if they '
+                         'were given when creating the solver!'.format(names))
+
+    return result
+
+
+def fields_compatible(fields, new_fields):
+    r"""Return whether the new fields have the same names as the entries of a
+    dictionary created by `copy_fields` and can be assigned to them in
+    place"""
+    if set(new_fields) != set(fields):
+        return False
+
+    for name, value in new_fields.items():
+
+        field = fields[name]
+        if isinstance(field, firedrake.Function):
+            if not (isinstance(value, firedrake.Function) and
+                    value.function_space() == field.function_space()):
+                return False
+        elif isinstance(field, firedrake.Constant):
+            if not (isinstance(value, firedrake.Constant) and
+                    value.ufl_shape == field.ufl_shape):
+                return False
+        elif not _same_value(field, value):
+            return False
+
+    return True
+
+
+def fields_equal(fields, new_fields):
+    r"""Return whether the new fields have exactly the same values as the
+    corresponding entries of a dictionary created by `copy_fields`
+
+    This is used to check whether an operator that depends on these fields
+    needs to be reassembled.
+    """
+    for name, value in new_fields.items():
+        field = fields[name]
+        if isinstance(field, firedrake.Function):
+            if not isinstance(value, firedrake.Function):
+                return False
+            local = np.array_equal(field.dat.data_ro, value.dat.data_ro)
+            if not field.comm.allreduce(local, op=min):
+                return False
+        elif isinstance(field, firedrake.Constant):
+            if not np.array_equal(field.values(), value.values()):
+                return False
+        elif not _same_value(field, value):
+            return False
+
+    return True
+
+
+def update_fields(fields, new_fields):
+    r"""Assign new values to a dictionary of fields created by `copy_fields`
+
+    Functions and constants are updated in place, so that any forms that
+    were created from them see the new values. Any other value can only be
+    "updated" to itself.
+
+    Raises
+    ------
+    ValueError
+        If one of the new fields was not in the original dictionary or can't
+        be updated in place
+    """
+    for name, value in new_fields.items():
+        if name not in fields:
+            raise ValueError('No input field named "{}"!'.format(name))
+
+        field = fields[name]
+        if isinstance(field, (firedrake.Function, firedrake.Constant)):
+            field.assign(value)
+        elif not _same_value(field, value):
+            raise ValueError('Input field "{}" is not a function or constant '
+                             'and cannot be updated in place!'.format(name))
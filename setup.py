@@ -27,6 +27,7 @@ setup(
                       'meshio>=3.3.1'],
     extras_require = {
         'doc': ['sphinx', 'sphinxcontrib-bibtex', 'sphinx_rtd_theme',
-                'ipykernel', 'nbconvert']
+                'ipykernel', 'nbconvert'],
+        'netcdf': ['xarray', 'netCDF4']
     }
 )
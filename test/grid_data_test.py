@@ -10,10 +10,12 @@
 # The full text of the license can be found in the file LICENSE in the
 # icepack source directory or at <http://www.gnu.org/licenses/>.
 
+import pytest
 import numpy as np
 import rasterio
 import firedrake
 import icepack
+from icepack.interpolate import RasterCache, GriddedSource
 
 def test_interpolating_to_mesh():
     # Make the mesh the square `[1/4, 3/4] x [1/4, 3/4]`
@@ -70,3 +72,275 @@ def test_interpolating_to_mesh():
     v = icepack.interpolate((vx, vy), V)
 
     assert firedrake.norm(u - v) / firedrake.norm(u) < 1/n
+
+
+# Check that the interpolation methods are exact or nearly exact for data
+# that are linear functions of the pixel center coordinates.
+@pytest.mark.parametrize('method', ['nearest', 'linear', 'cubic'])
+def test_interpolation_methods(method):
+    nx, ny = 32, 32
+    mesh = firedrake.UnitSquareMesh(nx, ny)
+    x, y = firedrake.SpatialCoordinate(mesh)
+    Vc = mesh.coordinates.function_space()
+    f = firedrake.interpolate(firedrake.as_vector((x/2 + 1/4, y/2 + 1/4)), Vc)
+    mesh.coordinates.assign(f)
+
+    n = 64
+    dx = 1.0 / n
+    transform = rasterio.transform.from_origin(west=0.0, north=1.0,
+                                               xsize=dx, ysize=dx)
+
+    # The pixel centers are at `((j + 1/2) * dx, 1 - (i + 1/2) * dx)`
+    array = np.array([[(j + 0.5) * dx + 2 * (1 - (i + 0.5) * dx)
+                       for j in range(n)] for i in range(n)])
+    array[-1, 0] = np.nan
+
+    memfile = rasterio.MemoryFile(ext='.tif')
+    opts = {'driver': 'GTiff', 'count': 1, 'width': n, 'height': n,
+            'dtype': array.dtype, 'transform': transform, 'nodata': np.nan}
+    with memfile.open(**opts) as dataset:
+        dataset.write(array, indexes=1)
+    dataset = memfile.open()
+
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=2)
+    p = firedrake.interpolate(x + 2 * y, Q)
+    q = icepack.interpolate(dataset, Q, method=method)
+
+    tolerance = {'nearest': 2 / n, 'linear': 1e-10, 'cubic': 1e-4}[method]
+    assert firedrake.norm(p - q) / firedrake.norm(p) < tolerance
+
+
+# Check that interpolating repeatedly from the same raster reuses the decoded
+# tiles, both from memory and from the on-disk cache.
+def test_raster_cache(tmpdir):
+    n = 64
+    dx = 1.0 / n
+    transform = rasterio.transform.from_origin(west=0.0, north=1.0,
+                                               xsize=dx, ysize=dx)
+    array = np.array([[(j + 0.5) * dx + 2 * (1 - (i + 0.5) * dx)
+                       for j in range(n)] for i in range(n)])
+
+    filename = str(tmpdir.join('data.tif'))
+    opts = {'driver': 'GTiff', 'count': 1, 'width': n, 'height': n,
+            'dtype': array.dtype, 'transform': transform}
+    with rasterio.open(filename, 'w', **opts) as dataset:
+        dataset.write(array, indexes=1)
+
+    mesh = firedrake.UnitSquareMesh(32, 32)
+    x, y = firedrake.SpatialCoordinate(mesh)
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=1)
+    p = firedrake.interpolate(x + 2 * y, Q)
+
+    cache = RasterCache(tile_size=16, directory=str(tmpdir.join('cache')))
+    with rasterio.open(filename, 'r') as dataset:
+        q1 = icepack.interpolate(dataset, Q, cache=cache)
+        misses = cache.misses
+        assert misses == (n // 16)**2
+        q2 = icepack.interpolate(dataset, Q, cache=cache)
+        assert cache.misses == misses
+        assert cache.hits >= misses
+
+    cache.clear()
+    assert cache.size == 0
+    with rasterio.open(filename, 'r') as dataset:
+        q3 = icepack.interpolate(dataset, Q, cache=cache)
+
+    for q in [q1, q2, q3]:
+        assert firedrake.norm(p - q) / firedrake.norm(p) < 1e-10
+    assert len(tmpdir.join('cache').listdir()) == (n // 16)**2
+
+
+class ArraySource(GriddedSource):
+    def __init__(self, name, array, transform):
+        self.name = name
+        self.height, self.width = array.shape
+        self.transform = transform
+        self._array = array
+
+    def read_window(self, bounds, band=1):
+        row_start, row_stop, col_start, col_stop = bounds
+        return self._array[row_start:row_stop, col_start:col_stop].copy()
+
+
+# Check that points that all lie past the last row and column of a raster
+# take the value of its corner pixel.
+@pytest.mark.parametrize('method', ['nearest', 'linear', 'cubic'])
+def test_interpolating_outside_raster(method):
+    n = 32
+    dx = 1.0 / n
+    transform = rasterio.transform.from_origin(west=0.0, north=1.0,
+                                               xsize=dx, ysize=dx)
+    array = np.array([[np.sin(3 * j * dx) + np.cos(2 * i * dx)
+                       for j in range(n)] for i in range(n)])
+    source = ArraySource('array', array, transform)
+
+    # Move the mesh to the square `[2, 3] x [-2, -1]`, which is to the
+    # south-east of the raster
+    mesh = firedrake.UnitSquareMesh(16, 16)
+    x, y = firedrake.SpatialCoordinate(mesh)
+    Vc = mesh.coordinates.function_space()
+    f = firedrake.interpolate(firedrake.as_vector((x + 2, y - 2)), Vc)
+    mesh.coordinates.assign(f)
+
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=1)
+    q = icepack.interpolate(source, Q, method=method)
+    assert np.allclose(q.dat.data_ro, array[-1, -1])
+
+
+# Check that a shared cache doesn't mix up the tiles of data sets that have
+# the same name but different georeferencing.
+def test_raster_cache_geometry():
+    n = 32
+    dx = 1.0 / n
+    array = np.array([[np.sin(3 * j * dx) + np.cos(2 * i * dx)
+                       for j in range(n)] for i in range(n)])
+    sources = [
+        ArraySource('array', array, rasterio.transform.from_origin(
+            west=west, north=1.0, xsize=dx, ysize=dx))
+        for west in [0.0, -0.25]
+    ]
+
+    mesh = firedrake.UnitSquareMesh(16, 16)
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=1)
+    cache = RasterCache(tile_size=8)
+    for source in sources:
+        p = icepack.interpolate(source, Q)
+        q = icepack.interpolate(source, Q, cache=cache)
+        assert np.array_equal(p.dat.data_ro, q.dat.data_ro)
+
+
+# Check that reading everything on one process and sending the windows to the
+# others gives the same result as reading on every process.
+def test_root_reader():
+    n = 32
+    dx = 1.0 / n
+    transform = rasterio.transform.from_origin(west=0.0, north=1.0,
+                                               xsize=dx, ysize=dx)
+    array = np.array([[np.sin((j + 0.5) * dx) * np.cos((i + 0.5) * dx)
+                       for j in range(n)] for i in range(n)])
+
+    memfile = rasterio.MemoryFile(ext='.tif')
+    opts = {'driver': 'GTiff', 'count': 1, 'width': n, 'height': n,
+            'dtype': array.dtype, 'transform': transform}
+    with memfile.open(**opts) as dataset:
+        dataset.write(array, indexes=1)
+    dataset = memfile.open()
+
+    mesh = firedrake.UnitSquareMesh(16, 16)
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=2)
+    V = firedrake.VectorFunctionSpace(mesh, family='CG', degree=1)
+
+    f = dataset if mesh.comm.rank == 0 else None
+    p = icepack.interpolate(dataset, Q, cache=None)
+    q = icepack.interpolate(f, Q, cache=None, root_reader=True)
+    assert np.array_equal(p.dat.data_ro, q.dat.data_ro)
+
+    u = icepack.interpolate((dataset, dataset), V, cache=None)
+    v = icepack.interpolate((f, f) if f is not None else None, V,
+                            cache=None, root_reader=True)
+    assert np.array_equal(u.dat.data_ro, v.dat.data_ro)
+
+    # The root process decides whether the arguments are valid, so every
+    # process raises the same error rather than waiting on the others
+    with pytest.raises(ValueError):
+        icepack.interpolate(f, V, root_reader=True)
+    with pytest.raises(ValueError):
+        icepack.interpolate((f, f) if f is not None else None, Q,
+                            root_reader=True)
+
+
+# Check that interpolating from a NetCDF variable gives the same result as
+# interpolating from the same data stored as a raster.
+def test_netcdf_source(tmpdir):
+    xarray = pytest.importorskip('xarray')
+
+    n = 32
+    dx = 1.0 / n
+    xs = (np.arange(n) + 0.5) * dx
+    ys = 1 - (np.arange(n) + 0.5) * dx
+    array = np.array([[x + 2 * y for x in xs] for y in ys])
+    array[0, -1] = np.nan
+
+    filename = str(tmpdir.join('data.nc'))
+    dataset = xarray.Dataset(
+        {'z': (('y', 'x'), array),
+         'w': (('t', 'y', 'x'), np.stack((array, 2 * array)))},
+        coords={'x': xs, 'y': ys, 't': [0.0, 1.0]}
+    )
+    dataset.to_netcdf(filename)
+
+    transform = rasterio.transform.from_origin(west=0.0, north=1.0,
+                                               xsize=dx, ysize=dx)
+    memfile = rasterio.MemoryFile(ext='.tif')
+    opts = {'driver': 'GTiff', 'count': 1, 'width': n, 'height': n,
+            'dtype': array.dtype, 'transform': transform, 'nodata': np.nan}
+    with memfile.open(**opts) as raster:
+        raster.write(array, indexes=1)
+    raster = memfile.open()
+
+    mesh = firedrake.UnitSquareMesh(16, 16)
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=2)
+    p = icepack.interpolate(raster, Q, cache=None)
+
+    cache = RasterCache(directory=str(tmpdir.join('cache')))
+    with icepack.NetCDFSource(filename, 'z') as source:
+        q = icepack.interpolate(source, Q, cache=cache)
+    assert np.allclose(p.dat.data_ro, q.dat.data_ro)
+
+    # Different slices of the same variable mustn't share cached tiles
+    with icepack.NetCDFSource(filename, 'w', t=0.0) as source:
+        q = icepack.interpolate(source, Q, cache=cache)
+    assert np.allclose(p.dat.data_ro, q.dat.data_ro)
+
+    with icepack.NetCDFSource(filename, 'w', t=1.0) as source:
+        q = icepack.interpolate(source, Q, cache=cache)
+    assert np.allclose(2 * p.dat.data_ro, q.dat.data_ro)
+
+    with pytest.raises(ValueError):
+        icepack.NetCDFSource(filename, 'w')
+
+
+# Check that averaging fine-scale data over each cell of a coarse mesh gives
+# the cell means rather than aliasing the oscillations at the nodes.
+def test_cell_averages():
+    n = 256
+    dx = 1.0 / n
+    transform = rasterio.transform.from_origin(west=0.0, north=1.0,
+                                               xsize=dx, ysize=dx)
+    xs = (np.arange(n) + 0.5) * dx
+    ys = 1 - (np.arange(n) + 0.5) * dx
+    k = 2 * np.pi * n / 4
+    array = np.array([[x + 2 * y + np.sin(k * x) for x in xs] for y in ys])
+
+    memfile = rasterio.MemoryFile(ext='.tif')
+    opts = {'driver': 'GTiff', 'count': 1, 'width': n, 'height': n,
+            'dtype': array.dtype, 'transform': transform}
+    with memfile.open(**opts) as dataset:
+        dataset.write(array, indexes=1)
+    dataset = memfile.open()
+
+    mesh = firedrake.UnitSquareMesh(8, 8)
+    x, y = firedrake.SpatialCoordinate(mesh)
+    Q0 = firedrake.FunctionSpace(mesh, family='DG', degree=0)
+    p0 = firedrake.project(x + 2 * y, Q0)
+    q0 = icepack.interpolate(dataset, Q0, method='average')
+    assert firedrake.norm(p0 - q0) / firedrake.norm(p0) < 0.02
+
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=1)
+    p = firedrake.interpolate(x + 2 * y, Q)
+    q = icepack.interpolate(dataset, Q, method='average')
+    assert abs(firedrake.assemble((q - p) * firedrake.dx)) < 5e-3
+    assert firedrake.norm(p - q) / firedrake.norm(p) < 0.05
+
+    # The cache keeps the pixel indices along with the tiles, and they count
+    # towards its size
+    cache = RasterCache(tile_size=64)
+    for k in range(2):
+        r = icepack.interpolate(dataset, Q, method='average', cache=cache)
+        assert np.array_equal(q.dat.data_ro, r.dat.data_ro)
+    assert cache.size > 0
+    cache.clear()
+    assert cache.size == 0
+
+    with pytest.raises(ValueError):
+        icepack.interpolate(dataset, Q, method='mean')
@@ -14,6 +14,7 @@ import numpy as np
 import firedrake
 from firedrake import assemble, inner, as_vector, Constant, dx, ds_t, ds_b
 import icepack.models
+from icepack.models.heat_transport import HeatTransportSolver
 from icepack.constants import (year, thermal_diffusivity as α,
                                melting_temperature as Tm)
 
@@ -159,3 +160,48 @@ def test_strain_heating():
         E_0.assign(model.solve(dt, E0=E_0, q=Constant(0), **kwargs))
 
     assert assemble(E_q * h * dx) > assemble(E_0 * h * dx)
+
+
+def test_solver_reuse():
+    E_initial = firedrake.interpolate(E_surface + q_bed / α * h * (1 - ζ), Q)
+
+    u0 = 100.0
+    du = 100.0
+    u_expr = as_vector((u0 + du * x / Lx, 0))
+    u = firedrake.interpolate(u_expr, V)
+    w = firedrake.interpolate((-du / Lx + dh / Lx / h * u[0]) * ζ, W)
+
+    kwargs = {'u': u, 'w': w, 'h': h, 's': s, 'q': Constant(0),
+              'q_bed': q_bed, 'E_inflow': E_initial,
+              'E_surface': Constant(E_surface)}
+
+    dt = 10.0
+    model = icepack.models.HeatTransport3D()
+    solver = HeatTransportSolver(model, dt, E0=E_initial, **kwargs)
+    E = E_initial.copy(deepcopy=True)
+    E_split = E_initial.copy(deepcopy=True)
+    for step in range(5):
+        E = solver.solve(dt, E0=E, **kwargs)
+        model._advect(dt, E=E_split, u=u, w=w, h=h, s=s,
+                      E_inflow=E_initial, E_surface=kwargs['E_surface'])
+        model._diffuse(dt, E=E_split, h=h, q=kwargs['q'], q_bed=q_bed,
+                       E_surface=kwargs['E_surface'])
+
+    assert solver.num_advection_assemblies == 1
+    assert solver.num_diffusion_assemblies == 1
+    error = assemble((E - E_split)**2 * h * dx)
+    assert error / assemble(E_split**2 * h * dx) < 1e-12
+
+    # Changing the velocity only requires reassembling the advection matrix
+    u.assign(2 * u)
+    w.assign(2 * w)
+    E = solver.solve(dt, E0=E, **kwargs)
+    model._advect(dt, E=E_split, u=u, w=w, h=h, s=s,
+                  E_inflow=E_initial, E_surface=kwargs['E_surface'])
+    model._diffuse(dt, E=E_split, h=h, q=kwargs['q'], q_bed=q_bed,
+                   E_surface=kwargs['E_surface'])
+
+    assert solver.num_advection_assemblies == 2
+    assert solver.num_diffusion_assemblies == 1
+    error = assemble((E - E_split)**2 * h * dx)
+    assert error / assemble(E_split**2 * h * dx) < 1e-12
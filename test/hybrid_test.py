@@ -10,6 +10,7 @@
 # The full text of the license can be found in the file LICENSE in the
 # icepack source directory or at <http://www.gnu.org/licenses/>.
 
+import pytest
 import numpy as np
 import firedrake
 import icepack, icepack.models
@@ -120,3 +121,29 @@ def test_diagnostic_solver():
         error = np.linalg.norm(us[vdegree, :] - us[max_degree, :]) / norm
         print(error, flush=True)
         assert error < 1e-2
+
+
+# Check the tabulated projection of the water pressure against the symbolic
+# calculation that it replaced.
+@pytest.mark.parametrize('N', [1, 2, 3, 4, 5])
+def test_pressure_approx(N):
+    sympy = pytest.importorskip('sympy')
+    from icepack.models.hybrid import _pressure_approx
+
+    ζ, ζ_sl = sympy.symbols('ζ ζ_sl', real=True, positive=True)
+
+    def legendre(n):
+        return sympy.legendre(n, 2 * ζ - 1)
+
+    def coefficient(n):
+        Sn = legendre(n)
+        norm_square = sympy.integrate(Sn**2, (ζ, 0, 1))
+        return sympy.integrate((ζ_sl - ζ) * Sn, (ζ, 0, ζ_sl)) / norm_square
+
+    polynomial = sum([coefficient(n) * legendre(n) for n in range(N)])
+    exact = sympy.lambdify((ζ, ζ_sl), polynomial)
+
+    approx = _pressure_approx(N)
+    for z in np.linspace(0, 1, 6):
+        for z_sl in np.linspace(0, 1, 6):
+            assert abs(approx(z, z_sl) - exact(z, z_sl)) < 1e-12
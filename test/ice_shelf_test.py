@@ -173,3 +173,104 @@ def test_diagnostic_solver_side_friction():
     u = ice_shelf.diagnostic_solve(u0=u_initial, h=h, A=A, Cs=Cs, **opts)
 
     assert icepack.norm(u) < icepack.norm(u_initial)
+
+
+# Check that reusing a diagnostic solver object for several different values
+# of the thickness gives the same results as the solver that the model keeps
+# for `diagnostic_solve`.
+def test_diagnostic_solver_reuse():
+    ice_shelf = icepack.models.IceShelf()
+    opts = {'dirichlet_ids': [1], 'side_wall_ids': [3, 4], 'tol': 1e-12}
+
+    mesh = firedrake.RectangleMesh(32, 32, Lx, Ly)
+    degree = 2
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', degree)
+    Q = firedrake.FunctionSpace(mesh, 'CG', degree)
+
+    x, y = firedrake.SpatialCoordinate(mesh)
+    u_initial = interpolate(as_vector((exact_u(x), 0)), V)
+    h = interpolate(h0 - dh * x / Lx, Q)
+    A = interpolate(firedrake.Constant(icepack.rate_factor(T)), Q)
+
+    solver = icepack.DiagnosticSolver(ice_shelf, u0=u_initial, h=h, A=A,
+                                      **opts)
+
+    solvers = []
+    for k in range(3):
+        h.assign(h - 10.0)
+        u = ice_shelf.diagnostic_solve(u0=u_initial, h=h, A=A, **opts)
+        v = solver.solve(u0=u_initial, h=h)
+        assert norm(u - v) / norm(u) < 1e-8
+        solvers.append(ice_shelf._diagnostic_solver)
+
+    # The model should have kept the solver from its first call.
+    assert all(s is solvers[0] for s in solvers)
+
+
+# Check that the diagnostic solver reports its convergence history.
+def test_diagnostic_solver_statistics():
+    ice_shelf = icepack.models.IceShelf()
+    opts = {'dirichlet_ids': [1], 'side_wall_ids': [3, 4], 'tol': 1e-12}
+
+    mesh = firedrake.RectangleMesh(32, 32, Lx, Ly)
+    degree = 2
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', degree)
+    Q = firedrake.FunctionSpace(mesh, 'CG', degree)
+
+    x, y = firedrake.SpatialCoordinate(mesh)
+    u_guess = interpolate(as_vector((exact_u(x) + perturb_u(x, y), 0)), V)
+    h = interpolate(h0 - dh * x / Lx, Q)
+    A = interpolate(firedrake.Constant(icepack.rate_factor(T)), Q)
+
+    slopes = []
+    def callback(newton_solver):
+        slopes.append(newton_solver.statistics.slopes[-1])
+
+    solver = icepack.DiagnosticSolver(ice_shelf, u0=u_guess, h=h, A=A,
+                                      callback=callback, **opts)
+    solver.solve()
+
+    stats = solver.statistics
+    assert stats.converged
+    assert stats.iterations > 0
+    assert len(slopes) == stats.iterations
+    assert len(stats.residual_norms) == stats.iterations + 1
+    assert len(stats.line_search_evaluations) == stats.iterations
+    assert all(t >= 0 for t in stats.timings.values())
+    assert abs(stats.slopes[-1]) < abs(stats.slopes[0])
+
+
+# Check that the coupled thickness-velocity solver keeps an ice shelf that is
+# in steady state there, even with much longer timesteps than the usual
+# operator splitting would be used with.
+def test_coupled_solver():
+    nx, ny = 32, 32
+    mesh = firedrake.RectangleMesh(nx, ny, Lx, Ly)
+    x, y = firedrake.SpatialCoordinate(mesh)
+
+    degree = 2
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', degree)
+    Q = firedrake.FunctionSpace(mesh, 'CG', degree)
+
+    ρ = ρ_I * (1 - ρ_I / ρ_W)
+    q = (n + 1) * (ρ * g * h0 * u0 / 4)**n * icepack.rate_factor(T)
+    ux = (u0**(n + 1) + q * x)**(1/(n + 1))
+    h = interpolate(h0 * u0 / ux, Q)
+    u = interpolate(as_vector((ux, 0)), V)
+    h_initial = h.copy(deepcopy=True)
+
+    A = firedrake.Constant(icepack.rate_factor(T))
+    a = firedrake.Constant(0.0)
+
+    model = icepack.models.IceShelf()
+    solver = icepack.CoupledSolver(
+        model, 10.0, u, h, a, dirichlet_ids=[1], side_wall_ids=[3, 4],
+        h_inflow=h_initial, A=A, tol=1e-10)
+
+    for step in range(5):
+        h, u = solver.solve()
+
+    assert icepack.norm(h - h_initial) / icepack.norm(h_initial) < 1e-2
+
+    u_exact = interpolate(as_vector((ux, 0)), V)
+    assert icepack.norm(u - u_exact) / icepack.norm(u_exact) < 1e-2
@@ -83,6 +83,7 @@ def test_manufactured_solution():
 
 
 # Now test our numerical solvers against this analytical solution.
+import pytest
 import firedrake
 from firedrake import interpolate, as_vector
 import icepack, icepack.models
@@ -175,6 +176,40 @@ def test_diagnostic_solver_convergence():
         assert slope > degree + 0.9
 
 
+# Check that the iterative linear solver configurations give the same answer
+# as the direct solver.
+@pytest.mark.parametrize('solver_parameters', ['cg-gamg', 'cg-block-gamg'])
+def test_diagnostic_solver_iterative(solver_parameters):
+    ice_stream = icepack.models.IceStream()
+    opts = {'dirichlet_ids': [1], 'side_wall_ids': [3, 4], 'tol': 1e-12}
+
+    N = 32
+    mesh = firedrake.RectangleMesh(N, N, Lx, Ly)
+    x, y = firedrake.SpatialCoordinate(mesh)
+
+    degree = 2
+    Q = firedrake.FunctionSpace(mesh, 'CG', degree)
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', degree)
+
+    u_exact = interpolate(as_vector((exact_u(x), 0)), V)
+    u_guess = interpolate(u_exact + as_vector((perturb_u(x, y), 0)), V)
+
+    h = interpolate(h0 - dh * x/Lx, Q)
+    s = interpolate(d + h0 - dh + ds * (1 - x / Lx), Q)
+    C = interpolate(friction(x), Q)
+    A = interpolate(firedrake.Constant(icepack.rate_factor(T)), Q)
+
+    fields = {'h': h, 's': s, 'A': A, 'C': C, 'u0': u_guess}
+    u_direct = ice_stream.diagnostic_solve(**fields, **opts)
+    u_iterative = ice_stream.diagnostic_solve(
+        **fields, **opts, solver_parameters=solver_parameters)
+    assert norm(u_direct - u_iterative) / norm(u_direct) < 1e-6
+
+    u_inexact = ice_stream.diagnostic_solve(
+        **fields, **opts, solver_parameters=solver_parameters, inexact=True)
+    assert norm(u_direct - u_inexact) / norm(u_direct) < 1e-6
+
+
 def test_computing_surface():
     N = 16
     mesh = firedrake.RectangleMesh(N, N, Lx, Ly)
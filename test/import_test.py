@@ -0,0 +1,68 @@
+# Copyright (C) 2020 by Daniel Shapero <shapero@uw.edu>
+#
+# This file is part of icepack.
+#
+# icepack is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The full text of the license can be found in the file LICENSE in the
+# icepack source directory or at <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import subprocess
+import pytest
+
+heavy_modules = ['pygmsh', 'shapely', 'geojson', 'pooch', 'requests',
+                 'rasterio', 'sympy', 'matplotlib', 'scipy.optimize',
+                 'scipy.ndimage']
+
+
+def run(script):
+    output = subprocess.check_output([sys.executable, '-c', script])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+# Check that importing the package and using a model and a solver doesn't
+# pull in any of the dependencies that are only needed for meshing, fetching
+# data, or plotting, and report how long the import takes. Firedrake is
+# imported first, both so that the timing only measures icepack itself and
+# so that anything firedrake loads on its own isn't blamed on icepack.
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='lazy imports need Python 3.7 or later')
+def test_lazy_imports():
+    script = '''
+import sys, time, json
+import firedrake
+before = set(sys.modules)
+start = time.perf_counter()
+import icepack
+elapsed = time.perf_counter() - start
+model = icepack.models.IceShelf()
+solver_type = icepack.DiagnosticSolver
+A = icepack.rate_factor(260.0)
+loaded = set(sys.modules) - before
+print(json.dumps({{'time': elapsed,
+                   'modules': [name for name in {} if name in loaded]}}))
+'''.format(repr(heavy_modules))
+
+    results = run(script)
+    print('import icepack: {:.3f}s'.format(results['time']))
+    assert not results['modules']
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='lazy imports need Python 3.7 or later')
+def test_lazy_attributes():
+    script = '''
+import json, icepack, icepack.models
+names = ['meshing', 'datasets', 'plot', 'inverse', 'models', 'Simulation',
+         'CoupledSolver', 'interpolate', 'norm']
+found = [hasattr(icepack, name) for name in names]
+found.append(hasattr(icepack.models, 'HybridModel'))
+found.append(callable(icepack.interpolate))
+print(json.dumps(found))
+'''
+    assert all(run(script))
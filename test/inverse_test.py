@@ -94,6 +94,7 @@ def test_poisson_inverse(solver_type):
     print('Number of iterations: {}'.format(iterations))
 
     assert iterations < max_iterations
+    assert solver.num_linearizations == iterations + 1
     q = solver.parameter
     assert icepack.norm(q - q_true) < 0.25
 
@@ -15,7 +15,8 @@ import numpy as np
 import firedrake
 from firedrake import interpolate
 import icepack, icepack.models
-from icepack.models.mass_transport import ImplicitEuler, LaxWendroff
+from icepack.models.mass_transport import (ImplicitEuler, LaxWendroff,
+                                           ExplicitUpwind, MassTransportSolver)
 
 def norm(v):
     return icepack.norm(v, norm_type='L1')
@@ -68,6 +69,161 @@ def test_mass_transport_solver_convergence(solver_type):
     assert slope > degree - 0.1
 
 
+# Test the explicit discontinuous Galerkin scheme in the same way as the
+# implicit schemes, and check that it conserves mass when nothing flows in or
+# out of the domain.
+def test_explicit_upwind_convergence():
+    Lx, Ly = 1.0, 1.0
+    u0 = 1.0
+    h_in, dh = 1.0, 0.2
+
+    delta_x, error = [], []
+    mass_transport = ExplicitUpwind()
+    for N in range(24, 97, 8):
+        delta_x.append(Lx / N)
+
+        mesh = firedrake.RectangleMesh(N, N, Lx, Ly)
+        x, y = firedrake.SpatialCoordinate(mesh)
+
+        degree = 1
+        V = firedrake.VectorFunctionSpace(mesh, family='CG', degree=degree)
+        Q = firedrake.FunctionSpace(mesh, family='DG', degree=degree)
+
+        h0 = interpolate(h_in - dh * x / Lx, Q)
+        a = firedrake.Function(Q)
+        u = interpolate(firedrake.as_vector((u0, 0)), V)
+        T = 0.5
+        δt = icepack.utilities.courant_timestep(u, 1 / (2 * degree + 1))
+        num_timesteps = int(np.ceil(T / δt))
+        δt = T / num_timesteps
+
+        h = h0.copy(deepcopy=True)
+        for step in range(num_timesteps):
+            h = mass_transport.solve(δt, h0=h, a=a, u=u, h_inflow=h0)
+
+        z = x - u0 * T
+        h_exact = interpolate(h_in - dh/Lx * firedrake.max_value(0, z), Q)
+        error.append(norm(h - h_exact) / norm(h_exact))
+
+        print(delta_x[-1], error[-1])
+
+    log_delta_x = np.log2(np.array(delta_x))
+    log_error = np.log2(np.array(error))
+    slope, intercept = np.polyfit(log_delta_x, log_error, 1)
+
+    print('log(error) ~= {:g} * log(dx) + {:g}'.format(slope, intercept))
+    assert slope > degree - 0.1
+
+    # Use a rotational velocity field that is tangent to the boundary
+    x, y = firedrake.SpatialCoordinate(mesh)
+    ψ = firedrake.sin(np.pi * x) * firedrake.sin(np.pi * y)
+    u = interpolate(firedrake.as_vector((ψ.dx(1), -ψ.dx(0))), V)
+    h0 = interpolate(1 + firedrake.exp(-((x - 0.5)**2 + (y - 0.25)**2) / 0.01), Q)
+    δt = icepack.utilities.courant_timestep(u, 1 / (2 * degree + 1))
+    h = h0.copy(deepcopy=True)
+    for step in range(20):
+        h = mass_transport.solve(δt, h0=h, a=a, u=u)
+
+    mass_initial = firedrake.assemble(h0 * firedrake.dx)
+    mass_final = firedrake.assemble(h * firedrake.dx)
+    assert abs(mass_final - mass_initial) / mass_initial < 1e-6
+
+
+# Check that the solver objects only reassemble the matrix when the velocity or
+# the timestep have changed, and that reusing it gives the same answer as
+# building everything from scratch.
+@pytest.mark.parametrize('solver_type', [ImplicitEuler, LaxWendroff])
+def test_mass_transport_solver_reuse(solver_type):
+    N = 32
+    mesh = firedrake.UnitSquareMesh(N, N)
+    x, y = firedrake.SpatialCoordinate(mesh)
+
+    V = firedrake.VectorFunctionSpace(mesh, family='CG', degree=1)
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=1)
+
+    h0 = interpolate(1 - 0.2 * x, Q)
+    a = firedrake.Constant(0.1)
+    u = interpolate(firedrake.as_vector((1.0, 0.0)), V)
+    dt = 1.0 / N
+
+    solver = MassTransportSolver(solver_type(), dt, h0=h0, a=a, u=u,
+                                 h_inflow=h0)
+    h = h0.copy(deepcopy=True)
+    for step in range(4):
+        h = solver.solve(dt, h0=h, a=a, u=u, h_inflow=h0)
+
+    assert solver.num_matrix_assemblies == 1
+
+    h_fresh = h0.copy(deepcopy=True)
+    for step in range(4):
+        h_fresh = solver_type().solve(dt, h0=h_fresh, a=a, u=u, h_inflow=h0)
+    assert norm(h - h_fresh) / norm(h_fresh) < 1e-10
+
+    u.assign(firedrake.as_vector((1.0, 0.5)))
+    h = solver.solve(dt, h0=h, a=a, u=u, h_inflow=h0)
+    h_fresh = solver_type().solve(dt, h0=h_fresh, a=a, u=u, h_inflow=h0)
+    assert solver.num_matrix_assemblies == 2
+    assert norm(h - h_fresh) / norm(h_fresh) < 1e-10
+
+    h = solver.solve(dt / 2, h0=h, a=a, u=u, h_inflow=h0)
+    h_fresh = solver_type().solve(dt / 2, h0=h_fresh, a=a, u=u, h_inflow=h0)
+    assert solver.num_matrix_assemblies == 3
+    assert norm(h - h_fresh) / norm(h_fresh) < 1e-10
+
+
+# Check that sub-cycling takes the right number of substeps, that it agrees
+# with taking the short steps by hand, including when the velocity varies in
+# time.
+@pytest.mark.parametrize('solver_type', [ImplicitEuler, ExplicitUpwind])
+def test_subcycled_mass_transport(solver_type):
+    N = 32
+    mesh = firedrake.UnitSquareMesh(N, N)
+    x, y = firedrake.SpatialCoordinate(mesh)
+
+    family = 'DG' if solver_type is ExplicitUpwind else 'CG'
+    V = firedrake.VectorFunctionSpace(mesh, family='CG', degree=1)
+    Q = firedrake.FunctionSpace(mesh, family=family, degree=1)
+
+    h0 = interpolate(1 - 0.2 * x, Q)
+    a = firedrake.Constant(0.0)
+    u = interpolate(firedrake.as_vector((1.0, 0.0)), V)
+
+    courant_number = 0.25
+    δt = icepack.utilities.courant_timestep(u, courant_number)
+    num_substeps = 8
+    dt = num_substeps * δt * (1 - 1e-8)
+    δt = dt / num_substeps
+
+    mass_transport = solver_type()
+    h = mass_transport.subcycle(dt, h0=h0, a=a, u=u, h_inflow=h0,
+                                courant_number=courant_number)
+
+    h_steps = h0.copy(deepcopy=True)
+    for step in range(num_substeps):
+        h_steps = solver_type().solve(δt, h0=h_steps, a=a, u=u, h_inflow=h0)
+    assert norm(h - h_steps) / norm(h_steps) < 1e-8
+
+    # With a velocity that varies in time, the substeps use the velocity at
+    # the midpoint of each one; the time step is small enough that the
+    # Courant number of the final velocity stays below the limit too
+    u_end = interpolate(firedrake.as_vector((1.5, 0.0)), V)
+    h = mass_transport.subcycle(dt / 2, h0=h0, a=a, u=u, h_inflow=h0,
+                                u_end=u_end, courant_number=courant_number)
+
+    num_substeps = 6
+    δt = dt / 2 / num_substeps
+    h_steps = h0.copy(deepcopy=True)
+    for step in range(num_substeps):
+        θ = (step + 0.5) / num_substeps
+        v = interpolate(firedrake.as_vector((1 + 0.5 * θ, 0.0)), V)
+        h_steps = solver_type().solve(δt, h0=h_steps, a=a, u=v, h_inflow=h0)
+    assert norm(h - h_steps) / norm(h_steps) < 1e-8
+
+    h_fixed = mass_transport.subcycle(dt / 2, h0=h0, a=a, u=u, h_inflow=h0,
+                                      courant_number=courant_number)
+    assert norm(h - h_fixed) / norm(h_steps) > 1e-4
+
+
 from icepack.constants import (ice_density as ρ_I, water_density as ρ_W,
                                glen_flow_law as n, weertman_sliding_law as m,
                                gravity as g)
@@ -0,0 +1,43 @@
+# Copyright (C) 2019 by Daniel Shapero <shapero@uw.edu>
+#
+# This file is part of icepack.
+#
+# icepack is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The full text of the license can be found in the file LICENSE in the
+# icepack source directory or at <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import firedrake
+from icepack.optimization import _armijo_search
+
+
+# Check that the line search recovers when the objective blows up at the
+# first trial steps and is finite but too large at the next one, rather than
+# interpolating through the infinite values.
+@pytest.mark.parametrize('blowup', [np.inf, np.nan])
+def test_line_search_blowup(blowup):
+    def E(t):
+        if t > 0.6:
+            return blowup
+        if t > 0.3:
+            return 10.0
+        return (t - 0.2)**2
+
+    E0, slope = E(0.0), -0.4
+    α, Eα, num_evaluations = _armijo_search(E, E0, slope, armijo=1e-4,
+                                            contraction_factor=0.5)
+    assert 0 < α <= 0.3
+    assert Eα == E(α)
+    assert Eα <= E0 + 1e-4 * α * slope
+    assert num_evaluations < 10
+
+
+def test_line_search_failure():
+    with pytest.raises(firedrake.ConvergenceError):
+        _armijo_search(lambda t: np.inf, 0.0, -1.0, armijo=1e-4,
+                       contraction_factor=0.5, max_evaluations=20)
@@ -12,7 +12,9 @@
 
 import firedrake
 from firedrake import norm, interpolate, Constant, as_vector, sym, grad
+import icepack, icepack.models
 from icepack.utilities import eigenvalues
+from icepack.models.damage_transport import DamageSolver
 
 def test_eigenvalues():
     nx, ny = 32, 32
@@ -30,3 +32,36 @@ def test_eigenvalues():
 
     assert norm(λ1 - Constant(1)) < norm(u) / (nx * ny)
     assert norm(λ2) < norm(u) / (nx * ny)
+
+
+def test_damage_transport_reuse():
+    nx, ny = 32, 32
+    Lx, Ly = 20e3, 20e3
+    mesh = firedrake.RectangleMesh(nx, ny, Lx, Ly)
+    x, y = firedrake.SpatialCoordinate(mesh)
+
+    V = firedrake.VectorFunctionSpace(mesh, family='CG', degree=2)
+    Q = firedrake.FunctionSpace(mesh, family='DG', degree=1)
+
+    u = interpolate(as_vector((100.0 + 100.0 * x / Lx, 0)), V)
+    A = Constant(icepack.rate_factor(254.15))
+    r2 = (x - Lx / 2)**2 + (y - Ly / 2)**2
+    D0 = interpolate(0.1 * firedrake.exp(-r2 / 4e6), Q)
+
+    damage_model = icepack.models.DamageTransport()
+    dt = 1.0 / 12
+    solver = DamageSolver(damage_model, dt, D0=D0, u=u, A=A, D_inflow=D0)
+    D = D0.copy(deepcopy=True)
+    for step in range(6):
+        D = solver.solve(dt, D0=D, u=u, A=A, D_inflow=D0)
+
+    assert solver.num_mass_inverse_assemblies == 1
+    assert D.dat.data_ro.min() >= 0 and D.dat.data_ro.max() <= 1
+
+    D_fresh = D0.copy(deepcopy=True)
+    for step in range(6):
+        damage_model_fresh = icepack.models.DamageTransport()
+        D_fresh = damage_model_fresh.solve(dt, D0=D_fresh, u=u, A=A,
+                                           D_inflow=D0)
+
+    assert norm(D - D_fresh) <= 1e-10 * norm(D_fresh)
@@ -0,0 +1,234 @@
+# Copyright (C) 2020 by Daniel Shapero <shapero@uw.edu>
+#
+# This file is part of icepack.
+#
+# icepack is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The full text of the license can be found in the file LICENSE in the
+# icepack source directory or at <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import firedrake
+from firedrake import interpolate, as_vector
+import icepack, icepack.models
+from icepack.timestepping import VelocityExtrapolator
+from icepack.utilities import courant_timestep
+
+
+# Check that extrapolating a field that is a polynomial in time of the same
+# degree as the extrapolator is exact.
+@pytest.mark.parametrize('order', [1, 2])
+def test_velocity_extrapolation(order):
+    mesh = firedrake.UnitSquareMesh(8, 8)
+    x, y = firedrake.SpatialCoordinate(mesh)
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', 1)
+
+    def velocity(t):
+        return interpolate(as_vector((1 + t * x + t**order * y, t * y)), V)
+
+    extrapolator = VelocityExtrapolator(order=order)
+    assert extrapolator.predict(0.0) is None
+
+    times = [0.0, 0.5, 1.25]
+    for t in times[:order + 1]:
+        extrapolator.update(t, velocity(t))
+
+    t = 2.0
+    u_predicted = extrapolator.predict(t)
+    u_exact = velocity(t)
+    assert icepack.norm(u_predicted - u_exact) < 1e-10 * icepack.norm(u_exact)
+
+
+# Check that using the extrapolator in a diagnostic solver gives the same
+# answer as solving from the previous velocity.
+def test_diagnostic_solver_with_predictor():
+    Lx, Ly = 20e3, 20e3
+    h0, dh = 500.0, 100.0
+    T = 254.15
+    u_in = 100.0
+
+    mesh = firedrake.RectangleMesh(32, 32, Lx, Ly)
+    x, y = firedrake.SpatialCoordinate(mesh)
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', 2)
+    Q = firedrake.FunctionSpace(mesh, 'CG', 2)
+
+    u0 = interpolate(as_vector((u_in + 100 * x / Lx, 0)), V)
+    h = interpolate(h0 - dh * x / Lx, Q)
+    A = firedrake.Constant(icepack.rate_factor(T))
+
+    model = icepack.models.IceShelf()
+    opts = {'dirichlet_ids': [1], 'side_wall_ids': [3, 4], 'tol': 1e-12}
+    solver = icepack.DiagnosticSolver(model, u0=u0, h=h, A=A, **opts,
+                                      predictor=VelocityExtrapolator(order=2))
+
+    dt = 1.0
+    u = u0.copy(deepcopy=True)
+    for step in range(4):
+        h.assign(h - 5 * dt)
+        u_expected = model.diagnostic_solve(u0=u, h=h, A=A, **opts)
+        u = solver.solve(h=h, time=step * dt)
+        norm = icepack.norm(u_expected)
+        assert icepack.norm(u - u_expected) < 1e-8 * norm
+
+
+from icepack.constants import (ice_density as ρ_I, water_density as ρ_W,
+                               gravity as g, glen_flow_law as n,
+                               weertman_sliding_law as m, year,
+                               thermal_diffusivity as α)
+
+
+# Check that a simulation of an ice shelf that starts in steady state stays
+# there, and that the adaptive timestep respects the Courant condition.
+@pytest.mark.parametrize('thickness_tolerance', [0.0, 1e-3])
+def test_ice_shelf_simulation(thickness_tolerance):
+    Lx, Ly = 20e3, 20e3
+    h0, u0 = 500.0, 100.0
+    T = 254.15
+    ρ = ρ_I * (1 - ρ_I / ρ_W)
+
+    N = 32
+    mesh = firedrake.RectangleMesh(N, N, Lx, Ly)
+    x, y = firedrake.SpatialCoordinate(mesh)
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', 2)
+    Q = firedrake.FunctionSpace(mesh, 'CG', 2)
+
+    q = (n + 1) * (ρ * g * h0 * u0 / 4)**n * icepack.rate_factor(T)
+    ux = (u0**(n + 1) + q * x)**(1/(n + 1))
+    h = interpolate(h0 * u0 / ux, Q)
+    u = interpolate(as_vector((ux, 0)), V)
+    A = firedrake.Constant(icepack.rate_factor(T))
+    a = firedrake.Constant(0)
+
+    model = icepack.models.IceShelf()
+    courant_number = 0.5
+    simulation = icepack.Simulation(
+        model, u=u, h=h, a=a, A=A, dirichlet_ids=[1], side_wall_ids=[3, 4],
+        tol=1e-12, courant_number=courant_number, dt_max=0.25,
+        thickness_tolerance=thickness_tolerance)
+
+    timesteps = []
+    def callback(simulation):
+        timesteps.append(simulation.time)
+
+    final_time = 1.0
+    simulation.run(final_time, callback=callback)
+    assert abs(simulation.time - final_time) < 1e-12
+    assert simulation.num_steps == len(timesteps)
+    assert simulation.num_diagnostic_solves <= simulation.num_steps + 1
+
+    # The diameter of the triangles in this mesh is sqrt(2) * δx
+    u_max = icepack.norm(simulation.velocity, norm_type='Linfty')
+    δx = Lx / N
+    dt = courant_timestep(simulation.velocity, courant_number)
+    assert abs(dt - courant_number * np.sqrt(2) * δx / u_max) < 1e-6 * dt
+    assert simulation.timestep() == min(dt, 0.25)
+
+    error = icepack.norm(simulation.thickness - h) / icepack.norm(h)
+    assert error < 1e-2
+
+
+# Check that the Courant timestep is limited by the smallest cells next to a
+# node where the speed is largest, even when the node is shared with larger
+# cells.
+def test_courant_timestep_graded_mesh():
+    N = 16
+    mesh = firedrake.UnitSquareMesh(N, N)
+    x, y = firedrake.SpatialCoordinate(mesh)
+
+    # Squeeze the left half of the mesh into `[0, 1/4]` and stretch the right
+    # half over `[1/4, 1]`
+    Vc = mesh.coordinates.function_space()
+    ξ = firedrake.conditional(x < 0.5, x / 2, 1.5 * x - 0.5)
+    mesh.coordinates.assign(interpolate(as_vector((ξ, y)), Vc))
+
+    # The speed is largest along the line between the small and large cells
+    x, y = firedrake.SpatialCoordinate(mesh)
+    V = firedrake.VectorFunctionSpace(mesh, 'CG', 1)
+    u = interpolate(as_vector((1 - abs(x - 0.25), 0)), V)
+
+    courant_number = 0.5
+    δx = 1 / N
+    diameter = np.sqrt((δx / 2)**2 + δx**2)
+    dt = courant_timestep(u, courant_number)
+    assert abs(dt - courant_number * diameter) < 1e-6 * dt
+
+
+# Check that the thermomechanical driver only refreshes the fluidity at the
+# requested interval, that the fluidity is consistent with the energy density
+# after a refresh, and that warmer ice flows faster.
+def test_thermomechanical_simulation():
+    Lx, Ly = 20e3, 20e3
+    h0, dh = 500.0, 100.0
+    T = 254.15
+    u_in = 100.0
+
+    mesh2d = firedrake.RectangleMesh(16, 16, Lx, Ly)
+    mesh = firedrake.ExtrudedMesh(mesh2d, layers=1)
+    V = firedrake.VectorFunctionSpace(mesh, dim=2, family='CG', degree=2,
+                                      vfamily='GL', vdegree=1)
+    Q = firedrake.FunctionSpace(mesh, family='CG', degree=2,
+                                vfamily='DG', vdegree=0)
+    Q_E = firedrake.FunctionSpace(mesh, family='CG', degree=2,
+                                  vfamily='GL', vdegree=2)
+
+    x, y, ζ = firedrake.SpatialCoordinate(mesh)
+    height_above_flotation = 10.0
+    d = -ρ_I / ρ_W * (h0 - dh) + height_above_flotation
+    ρ = ρ_I - ρ_W * d**2 / (h0 - dh)**2
+
+    Z = icepack.rate_factor(T) * (ρ * g * h0 / 4)**n
+    q = 1 - (1 - (dh/h0) * (x/Lx))**(n + 1)
+    ux = u_in + Z * q * Lx * (h0/dh) / (n + 1)
+    u = interpolate(as_vector((ux, 0)), V)
+
+    thickness = h0 - dh * x / Lx
+    β = 1/2
+    α_C = β * ρ / ρ_I * dh / Lx
+    h = interpolate(h0 - dh * x / Lx, Q)
+    ds = (1 + β) * ρ / ρ_I * dh
+    s = interpolate(d + h0 - dh + ds * (1 - x / Lx), Q)
+    b = interpolate(s - h, Q)
+    C = interpolate(α_C * (ρ_I * g * thickness) * ux**(-1/m), Q)
+
+    heat_model = icepack.models.HeatTransport3D()
+    E_surface = 480.0
+    q_bed = 50e-3 * year * 1e-6
+    E = interpolate(E_surface + q_bed / α * h * (1 - ζ), Q_E)
+
+    model = icepack.models.HybridModel()
+
+    def simulate(E):
+        simulation = icepack.ThermomechanicalSimulation(
+            model, heat_model, u, h, b, E, firedrake.Constant(0.0),
+            dirichlet_ids=[1], side_wall_ids=[3, 4], C=C,
+            q_bed=firedrake.Constant(q_bed), fluidity_update_interval=3)
+        assert simulation.num_fluidity_updates == 1
+
+        num_steps = 6
+        for step in range(num_steps):
+            simulation.step(1.0 / 12)
+        assert simulation.num_steps == num_steps
+        assert simulation.num_fluidity_updates == 1 + num_steps // 3
+        return simulation
+
+    simulation = simulate(E)
+
+    # The last step refreshed the fluidity, so it should be consistent with
+    # the current energy density
+    A = simulation.fluidity
+    temperature = heat_model.temperature(simulation.energy_density)
+    A_expected = interpolate(icepack.rate_factor(temperature),
+                             A.function_space())
+    assert icepack.norm(A - A_expected) <= 1e-8 * icepack.norm(A_expected)
+
+    # Warmer ice is softer and flows faster
+    E_warm = interpolate(E + 5.0, Q_E)
+    warm_simulation = simulate(E_warm)
+    A_warm = warm_simulation.fluidity
+    assert (A_warm.dat.data_ro > A.dat.data_ro).all()
+    assert (icepack.norm(warm_simulation.velocity) >
+            icepack.norm(simulation.velocity))